@@ -1,28 +1,23 @@
 import matplotlib.pyplot as plt
-from rebound import SimulationArchive, Particle, Simulation
+import numpy as np
 
 from extradata import ExtraData
+from orbit_table import load_orbit_table
 from utils import filename_from_argv, plot_settings, is_ci
 
 plot_settings()
 
 fn = filename_from_argv()
-sa = SimulationArchive(str(fn.with_suffix(".bin")))
 ed = ExtraData.load(fn)
 print(ed.meta)
 
 data = {}
-sim: Simulation
-print(f"{len(sa)} Snapshots found")
-for sim in sa:
-    t = sim.t
-    for pn in range(1, sim.N):
-        part: Particle = sim.particles[pn]
-        hash = part.hash.value
-        if hash not in data:
-            data[hash] = ([], [])
-        data[hash][0].append(t)
-        data[hash][1].append(part.a)
+orbits = load_orbit_table(fn, ed)
+print(f"{len(np.unique(orbits.snapshot))} Snapshots found")
+order = np.argsort(orbits.hash, kind="stable")
+hashes, starts = np.unique(orbits.hash[order], return_index=True)
+for hash, rows in zip(hashes.tolist(), np.split(order, starts[1:])):
+    data[hash] = (orbits.t[rows], orbits.a[rows])
 
 for name, d in data.items():
     times, values = d
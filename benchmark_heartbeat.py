@@ -0,0 +1,67 @@
+"""
+benchmark of the heartbeat with many bodies escaping at the same time:
+the same simulation is stepped once with batched removals (one synchronization per heartbeat pass)
+and once with a synchronization after every single removal
+
+usage: python benchmark_heartbeat.py [number of bodies] [number of escaping bodies]
+"""
+import time
+from pathlib import Path
+from sys import argv
+
+import numpy as np
+from rebound import Simulation, Particle
+
+from heartbeat_context import Heartbeat
+from utils import solar_radius
+from scipy.constants import astronomical_unit
+
+num_bodies = int(argv[1]) if len(argv) > 1 else 2000
+num_escaping = int(argv[2]) if len(argv) > 2 else 400
+
+
+def setup() -> Simulation:
+    rng = np.random.default_rng(1)
+    sim = Simulation()
+    sim.units = ('yr', 'AU', 'kg')
+    sim.integrator = "mercurius"
+    sim.dt = 1e-2
+    sim.ri_mercurius.hillfac = 3.
+    sim.testparticle_type = 1
+    sim.add(Particle(m=1.9885e+30, hash=1, r=solar_radius / astronomical_unit))
+    sim.add(m=1.898e27, a=5.2, e=0.048, hash=2, primary=sim.particles[0])
+    sim.add(m=5.683e26, a=9.58, e=0.056, hash=3, primary=sim.particles[0])
+    sim.N_active = 3
+    for i in range(num_bodies):
+        # the escaping bodies start just outside of the maximum distance
+        a = rng.uniform(151, 160) if i < num_escaping else rng.uniform(0.5, 4)
+        sim.add(m=1e21, a=a, e=rng.uniform(0, 0.05), inc=rng.uniform(0, 0.05), M=rng.uniform(0, 2 * np.pi),
+                hash=4 + i, primary=sim.particles[0])
+    sim.move_to_com()
+    return sim
+
+
+def run(batched: bool) -> float:
+    sim = setup()
+    heartbeat = Heartbeat(1024, logfile=Path("/dev/null"))
+    context = heartbeat.context
+    context.min_distance_from_sun_squared = 0.1 ** 2
+    context.max_distance_from_sun_squared = 150 ** 2
+    context.check_interval = 1
+    context.batch_removals = int(batched)
+    heartbeat.attach(sim)
+    start = time.perf_counter()
+    sim.integrate(sim.dt, exact_finish_time=0)
+    took = time.perf_counter() - start
+    assert sim.N == 3 + num_bodies - num_escaping, sim.N
+    num_events = len(heartbeat.drain_events())
+    assert num_events == num_escaping, num_events
+    return took
+
+
+print(f"{num_bodies} bodies, {num_escaping} escaping in the first heartbeat pass")
+batched = run(batched=True)
+single = run(batched=False)
+print(f"one synchronization per removal: {single:.3f} s")
+print(f"batched removals: {batched:.3f} s")
+print(f"speedup: {single / batched:.1f}x")
@@ -0,0 +1,62 @@
+"""
+benchmark of reading the orbits of all particles of a snapshot:
+property by property through rebound (like the plotting scripts used to) compared to orbital_elements()
+
+usage: python benchmark_orbits.py [number of bodies]
+"""
+import time
+from sys import argv
+
+import numpy as np
+from rebound import Simulation
+
+from utils import orbital_elements
+
+num_bodies = int(argv[1]) if len(argv) > 1 else 5000
+
+
+def same_angles(angles: np.ndarray, reference: list, atol: float) -> bool:
+    # compares modulo 2pi, so that 0 and 2pi - epsilon count as the same angle
+    return np.allclose(np.mod(angles - np.array(reference) + np.pi, 2 * np.pi) - np.pi, 0, atol=atol)
+
+
+def setup() -> Simulation:
+    rng = np.random.default_rng(1)
+    sim = Simulation()
+    sim.units = ('yr', 'AU', 'kg')
+    sim.add(m=1.9885e+30, hash=1)
+    sim.add(m=1.898e27, a=5.2, e=0.048, hash=2)
+    sim.add(m=5.683e26, a=9.58, e=0.056, hash=3)
+    for i in range(num_bodies):
+        sim.add(m=1e21, a=rng.uniform(0.5, 4), e=rng.uniform(0, 0.3), inc=rng.uniform(0, 0.2),
+                Omega=rng.uniform(0, 2 * np.pi), M=rng.uniform(0, 2 * np.pi), hash=4 + i)
+    sim.move_to_com()
+    return sim
+
+
+sim = setup()
+
+start = time.perf_counter()
+particles = sim.particles[1:]
+a = [p.a for p in particles]
+e = [p.e for p in particles]
+inc = [p.inc for p in particles]
+Omega = [p.Omega for p in particles]
+omega = [p.omega for p in particles]
+per_property = time.perf_counter() - start
+
+start = time.perf_counter()
+orbits = orbital_elements(sim, jacobi=True)
+vectorized = time.perf_counter() - start
+
+assert np.allclose(orbits["a"], a, rtol=1e-10)
+assert np.allclose(orbits["e"], e, rtol=1e-10)
+assert np.allclose(orbits["inc"], inc, rtol=1e-10)
+assert same_angles(orbits["Omega"], Omega, atol=1e-10)
+# the pericenter of nearly circular orbits is poorly defined
+assert same_angles(orbits["omega"], omega, atol=1e-6)
+
+print(f"{num_bodies} bodies")
+print(f"property by property: {per_property:.3f} s")
+print(f"orbital_elements: {vectorized:.4f} s")
+print(f"speedup: {per_property / vectorized:.0f}x")
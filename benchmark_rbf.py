@@ -0,0 +1,50 @@
+"""
+compares the dense RbfMassloss interpolation with the k-nearest-neighbour LocalRbfMassloss
+as the simulations use them (loaded through merge.load_estimator, queried with estimate()):
+load time, latency per collision including the input scaling and how much the results differ
+
+usage: python benchmark_rbf.py [number of queries]
+"""
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from sys import argv
+
+import numpy as np
+
+from extradata import Meta
+from massloss.rbf_massloss import load_scaled_dataset, dataset_file
+from merge import load_estimator
+
+num_queries = int(argv[1]) if len(argv) > 1 else 200
+
+# real collision parameters (alpha, velocity, projectile_mass, gamma) from the dataset
+scaler, scaled_data, _ = load_scaled_dataset(dataset_file)
+rng = np.random.default_rng(1)
+rows = scaled_data[rng.choice(len(scaled_data), size=min(num_queries, len(scaled_data)), replace=False)]
+inputs = (rows * scaler.stds + scaler.means)[:, :4]
+print(f"{len(inputs)} queries")
+
+results = {}
+for method in ["rbf", "localrbf"]:
+    start = time.perf_counter()
+    estimator = load_estimator(Meta(massloss_method=method))
+    load_time = time.perf_counter() - start
+    # RbfMassloss prints every query
+    with redirect_stdout(StringIO()):
+        start = time.perf_counter()
+        single = np.array([estimator.estimate(*row) for row in inputs])
+        single_time = (time.perf_counter() - start) / len(inputs)
+    start = time.perf_counter()
+    batch = estimator.estimate_batch(inputs)
+    batch_time = (time.perf_counter() - start) / len(inputs)
+    assert np.allclose(single, batch)
+    results[method] = single
+    print(f"{estimator.name}:")
+    print(f"  load time: {load_time:.3f} s")
+    print(f"  latency per estimate(): {single_time * 1e6:.0f} µs")
+    print(f"  latency per row of estimate_batch(): {batch_time * 1e6:.0f} µs")
+
+difference = np.abs(results["localrbf"] - results["rbf"])
+print(f"mean absolute difference (water, mantle, core): {difference.mean(axis=0)}")
+print(f"max absolute difference (water, mantle, core): {difference.max(axis=0)}")
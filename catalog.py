@@ -0,0 +1,192 @@
+"""
+SQLite index with one row per run (all Meta fields, file sizes, number of snapshots and collisions)
+so that scripts can select runs without parsing every .extra.json
+
+the catalog is stored as catalog.sqlite next to the runs and is updated by water_sim.py on every save
+usage:
+python catalog.py rebuild [directory]
+python catalog.py list [directory] [mode] [finished|unfinished]
+"""
+import sqlite3
+import threading
+import time
+from dataclasses import fields
+from pathlib import Path
+from sys import argv
+from typing import List, Optional, Set
+
+from extradata import ExtraData, Meta
+
+meta_columns = [field.name for field in fields(Meta)]
+extra_columns = ["name", "mode", "finished", "bin_size", "extra_size", "snapshot_count", "collision_count", "updated"]
+
+
+def catalog_file(directory: Path) -> Path:
+    return directory / "catalog.sqlite"
+
+
+# catalogs whose table already has all columns (checked once per process)
+_migrated: Set[Path] = set()
+_migrate_lock = threading.Lock()
+# one connection per catalog and thread for the updates during simulations (sqlite connections can't be shared)
+_thread_connections = threading.local()
+
+
+def connect(directory: Path) -> sqlite3.Connection:
+    file = catalog_file(directory).resolve()
+    db = sqlite3.connect(str(file), timeout=60)
+    db.row_factory = sqlite3.Row
+    with _migrate_lock:
+        if file not in _migrated:
+            migrate(db)
+            _migrated.add(file)
+    return db
+
+
+def migrate(db: sqlite3.Connection) -> None:
+    db.execute("CREATE TABLE IF NOT EXISTS runs (name TEXT PRIMARY KEY)")
+    existing = {row["name"] for row in db.execute("PRAGMA table_info(runs)")}
+    for column in extra_columns + meta_columns:
+        if column not in existing:
+            db.execute(f"ALTER TABLE runs ADD COLUMN {column}")
+    db.commit()
+
+
+def cached_connection(directory: Path) -> sqlite3.Connection:
+    """
+    the connection of this thread to the catalog in this directory (opened on first use and then kept open)
+    """
+    if not hasattr(_thread_connections, "connections"):
+        _thread_connections.connections = {}
+    connections = _thread_connections.connections
+    file = catalog_file(directory).resolve()
+    if file not in connections:
+        connections[file] = connect(directory)
+    return connections[file]
+
+
+def run_mode(fn: Path) -> Optional[str]:
+    from utils import mode_from_fn
+    try:
+        return mode_from_fn(fn)
+    except AttributeError:  # not a final_* run
+        return None
+
+
+def file_size(file: Path) -> int:
+    try:
+        return file.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def update_run(fn: Path, ed: ExtraData, snapshot_count: int, db: sqlite3.Connection = None) -> None:
+    """
+    insert or replace the row of this run in the catalog next to it
+    """
+    if db is None:
+        db = cached_connection(fn.parent)
+    values = {
+        "name": fn.name,
+        "mode": run_mode(fn),
+        "finished": ed.meta.current_time is not None and ed.meta.current_time >= ed.meta.tmax,
+        "bin_size": file_size(fn.with_suffix(".bin")),
+        "extra_size": sum(file_size(fn.with_suffix(suffix)) for suffix in [".extra.json", ".extra.journal", ".pdata.npy"]),
+        "snapshot_count": snapshot_count,
+        "collision_count": len(ed.tree.get_tree()),
+        "updated": time.time(),
+    }
+    for column in meta_columns:
+        values[column] = getattr(ed.meta, column)
+    columns = ", ".join(values)
+    placeholders = ", ".join("?" * len(values))
+    with db:
+        db.execute(f"INSERT OR REPLACE INTO runs ({columns}) VALUES ({placeholders})", list(values.values()))
+
+
+def rebuild(directory: Path) -> None:
+    from snapshots import Snapshots
+
+    db = connect(directory)
+    with db:
+        db.execute("DELETE FROM runs")
+    for file in sorted(directory.glob("*.extra.json")):
+        fn = file.with_name(file.name.replace(".extra.json", ""))
+        print(fn)
+        try:
+            ed = ExtraData.load(fn)
+        except FileNotFoundError as e:
+            print(f"skipping ({e.filename} is missing)")
+            continue
+        if fn.with_suffix(".bin").exists():
+            snapshot_count = len(Snapshots(fn))
+        else:
+            snapshot_count = 0
+        update_run(fn, ed, snapshot_count, db)
+    db.close()
+
+
+def find_runs(directory: Path, mode: str = None, finished: bool = None) -> List[sqlite3.Row]:
+    """
+    rows of all runs in the catalog of this directory, optionally only of one mode and/or (un)finished ones
+    """
+    conditions = []
+    parameters = []
+    if mode is not None:
+        conditions.append("mode = ?")
+        parameters.append(mode)
+    if finished is not None:
+        conditions.append("finished = ?")
+        parameters.append(finished)
+    query = "SELECT * FROM runs"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    db = connect(directory)
+    rows = db.execute(query + " ORDER BY name", parameters).fetchall()
+    db.close()
+    return rows
+
+
+def file_mtime(file: Path) -> float:
+    try:
+        return file.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def unfinished_runs(directory: Path) -> Set[str]:
+    """
+    names of the runs that are unfinished according to an up to date entry in the catalog
+
+    Runs that are missing from the catalog (e.g. simulated before it existed) or were changed after
+    their entry was written are not included and need to be checked with their ExtraData.
+    """
+    if not catalog_file(directory).exists():
+        return set()
+    names = set()
+    for row in find_runs(directory, finished=False):
+        fn = run_filename(directory, row)
+        last_change = max(file_mtime(fn.with_suffix(".extra.json")), file_mtime(fn.with_suffix(".extra.journal")))
+        if last_change <= row["updated"]:
+            names.add(row["name"])
+    return names
+
+
+def run_filename(directory: Path, row: sqlite3.Row) -> Path:
+    return directory / row["name"]
+
+
+if __name__ == '__main__':
+    command = argv[1] if len(argv) > 1 else "list"
+    directory = Path(argv[2] if len(argv) > 2 else "data")
+    if command == "rebuild":
+        rebuild(directory)
+    elif command == "list":
+        mode = argv[3] if len(argv) > 3 else None
+        finished = {"finished": True, "unfinished": False}.get(argv[4]) if len(argv) > 4 else None
+        for row in find_runs(directory, mode, finished):
+            print(f"{row['name']}\t{row['mode']}\t{'finished' if row['finished'] else 'running'}\t"
+                  f"{row['current_time']}/{row['tmax']}\t{row['collision_count']} collisions\t"
+                  f"{row['snapshot_count']} snapshots")
+    else:
+        raise ValueError(f"unknown command {command}")
@@ -4,10 +4,11 @@ from sys import argv
 from matplotlib import pyplot as plt
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
-from rebound import SimulationArchive, Simulation
+from rebound import Simulation
 from scipy.constants import mega
 
 from extradata import ExtraData, CollisionMeta
+from snapshots import Snapshots
 from utils import filename_from_argv, earth_mass, earth_water_mass, plot_settings, is_ci, is_potentially_habitable
 
 files = argv[1:]
@@ -42,9 +43,8 @@ for file in files:
     fn = filename_from_argv(file)
 
     ed = ExtraData.load(fn)
-    sa = SimulationArchive(str(fn.with_suffix(".bin")))
 
-    last_sim: Simulation = sa[-1]
+    last_sim: Simulation = Snapshots(fn)[-1]
     print([p.hash.value for p in last_sim.particles])
     print(last_sim.t)
 
@@ -53,7 +53,6 @@ for file in files:
             continue
         # if not is_potentially_habitable(particle):
         #     continue
-        masses = []
         objects = []
         times = []
         hash = particle.hash.value
@@ -68,25 +67,14 @@ for file in files:
                 if ed.pd(particle).water_mass_fraction > 1e-4:
                     num_water_rich_planets += 1
 
-        while True:
-            print(f"looking at {hash}")
-            try:
-                collision = ed.tree.get_tree()[hash]
-            except KeyError:
-                print("found end of the tree")
-                break
-            meta: CollisionMeta = collision["meta"]
-            parents = collision["parents"]
+        # follow the more massive parent back to the original body
+        lineage = ed.tree.main_lineage(hash, ed.pdata)
+        for hash in lineage[:-1]:
+            meta: CollisionMeta = ed.tree.get_tree()[hash]["meta"]
             print("mass:", ed.pdata[hash].total_mass / earth_mass)
-            masses.append(ed.pdata[hash].total_mass)
             objects.append(ed.pdata[hash])
             times.append(meta.time)
-            # print(collision)
-            if ed.pdata[parents[0]].total_mass > ed.pdata[parents[1]].total_mass:
-                hash = parents[0]
-            else:
-                hash = parents[1]
-        objects.append(ed.pdata[hash])
+        objects.append(ed.pdata[lineage[-1]])
         times.append(0)
         if len(times) < 3:
             continue
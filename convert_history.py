@@ -0,0 +1,20 @@
+"""
+converts the .history.json of old runs into the columnar <run>.history/ directory
+"""
+import json
+from sys import argv
+
+from extradata import History
+from utils import filename_from_argv
+
+for file in argv[1:]:
+    fn = filename_from_argv(file)
+    directory = fn.with_suffix(".history")
+    if directory.exists():
+        print(f"{directory} already exists")
+        continue
+    history = History()
+    with fn.with_suffix(".history.json").open() as f:
+        history.load_json(json.load(f))
+    history.save(directory)
+    print(f"converted {len(history)} rows to {directory}")
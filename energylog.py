@@ -0,0 +1,60 @@
+"""
+reader for the .energylog.bin files written by the heartbeat
+
+Every record has a fixed size (see struct hb_energy_record in heartbeat.c),
+so the file can be memory-mapped directly without any parsing.
+"""
+from pathlib import Path
+
+import numpy as np
+
+energylog_dtype = np.dtype([
+    ("time", np.float64),
+    ("energy", np.float64),
+    ("N", np.uint64),
+    ("steps", np.uint64),
+])
+
+
+def read_energylog(fn: Path) -> np.ndarray:
+    """
+    memory-maps the energy log of a simulation run
+
+    a partially written record at the end (from a running or killed simulation) is ignored
+    """
+    file = fn.with_suffix(".energylog.bin")
+    num_records = file.stat().st_size // energylog_dtype.itemsize
+    if not num_records:
+        return np.empty(0, dtype=energylog_dtype)
+    return np.memmap(file, dtype=energylog_dtype, mode="r", shape=(num_records,))
+
+
+def convert_csv(fn: Path) -> int:
+    """
+    converts the .energylog.csv of an old run (N and steps are unknown and stored as 0)
+    """
+    times, values = np.loadtxt(fn.with_suffix(".energylog.csv"), delimiter=",", unpack=True, ndmin=2)
+    records = np.zeros(len(times), dtype=energylog_dtype)
+    records["time"] = times
+    records["energy"] = values
+    with fn.with_suffix(".energylog.bin").open("xb") as f:
+        records.tofile(f)
+    return len(records)
+
+
+if __name__ == '__main__':
+    from sys import argv
+
+    from utils import filename_from_argv
+
+    if len(argv) > 2 and argv[1] == "convert":
+        for file in argv[2:]:
+            fn = filename_from_argv(file)
+            print(f"converted {convert_csv(fn)} records of {fn}")
+    else:
+        fn = filename_from_argv()
+        log = read_energylog(fn)
+        print(f"{len(log)} records")
+        if len(log):
+            rel_error = np.abs((log["energy"] - log["energy"][0]) / log["energy"][0])
+            print(f"t = {log['time'][-1]:.0f}, N = {log['N'][-1]}, max. relative energy error {rel_error.max():.3e}")
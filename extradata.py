@@ -1,9 +1,11 @@
 import json
+import os
 from copy import deepcopy
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Set, Optional, FrozenSet, Iterable
 
+import numpy as np
 from rebound import Particle
 from scipy.constants import astronomical_unit, year
 
@@ -27,6 +29,181 @@ class ParticleData:
         return 1 - self.core_mass_fraction - self.water_mass_fraction
 
 
+particle_types = ["sun", "gas giant", "embryo", "planetesimal"]
+particle_type_codes = {name: code for code, name in enumerate(particle_types)}
+
+particle_dtype = np.dtype([
+    ("hash", np.uint32),
+    ("water_mass_fraction", np.float64),
+    ("core_mass_fraction", np.float64),
+    ("type", np.uint8),  # index in particle_types
+    # NaN stands for None
+    ("escaped", np.float64),
+    ("collided_with_sun", np.float64),
+    ("wide_orbit", np.float64),
+    ("total_mass", np.float64),
+])
+particle_fields = list(ParticleData.__dataclass_fields__)
+
+
+class ParticleView:
+    """
+    behaves like the ParticleData of one particle, but reads from and writes to the ParticleStore
+    """
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: "ParticleStore", index: int):
+        self._store = store
+        self._index = index
+
+    water_mass = ParticleData.water_mass
+    mantle_mass_fraction = ParticleData.mantle_mass_fraction
+
+    def save(self) -> Dict:
+        return self._store.row_dict(self._index)
+
+    def __repr__(self):
+        values = ", ".join(f"{key}={value!r}" for key, value in self.save().items())
+        return f"ParticleView({values})"
+
+
+def _view_property(field: str) -> property:
+    def getter(self: ParticleView):
+        return self._store.get_value(self._index, field)
+
+    def setter(self: ParticleView, value):
+        self._store.set_value(self._index, field, value)
+
+    return property(getter, setter)
+
+
+for _field in particle_fields:
+    setattr(ParticleView, _field, _view_property(_field))
+
+
+class ParticleStore:
+    """
+    the ParticleData of all particles in one structured numpy array (indexed by hash)
+
+    It can be used like the dict of ParticleData it replaces (`store[hash].escaped = t`),
+    but also gives direct access to whole columns (`store.water_mass_fraction`, `store.type`, ...)
+    of all particles in insertion order.
+    `version` is increased on every change made through the store (not through the columns),
+    so results computed from it can be cached.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._data = np.zeros(capacity, dtype=particle_dtype)
+        self._size = 0
+        self._index: Dict[int, int] = {}
+        self.version = 0
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        if name not in particle_dtype.names:
+            raise AttributeError(name)
+        return self.data[name]
+
+    @property
+    def water_mass(self) -> np.ndarray:
+        return self.total_mass * self.water_mass_fraction
+
+    @property
+    def type_names(self) -> np.ndarray:
+        return np.array(particle_types)[self.type]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, hash: int) -> bool:
+        return hash in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def values(self):
+        return (ParticleView(self, index) for index in self._index.values())
+
+    def items(self):
+        return ((hash, ParticleView(self, index)) for hash, index in self._index.items())
+
+    def __getitem__(self, hash: int) -> ParticleView:
+        return ParticleView(self, self._index[hash])
+
+    def indices(self, hashes: Iterable[int]) -> np.ndarray:
+        """
+        rows of these particles in the columns
+        """
+        return np.fromiter((self._index[hash] for hash in hashes), dtype=np.int64)
+
+    def __setitem__(self, hash: int, particle_data: ParticleData) -> None:
+        if hash in self._index:
+            index = self._index[hash]
+        else:
+            if self._size == len(self._data):
+                self._data = np.resize(self._data, max(2 * len(self._data), 64))
+            index = self._size
+            self._size += 1
+            self._index[hash] = index
+            self._data[index]["hash"] = hash
+        for field in particle_fields:
+            self.set_value(index, field, getattr(particle_data, field))
+
+    def update(self, hash: int, changes: Dict) -> None:
+        if hash in self._index:
+            for field, value in changes.items():
+                self.set_value(self._index[hash], field, value)
+        else:
+            self[hash] = ParticleData(**changes)
+
+    def get_value(self, index: int, field: str):
+        value = self._data[field][index]
+        if field == "type":
+            return particle_types[value]
+        value = float(value)
+        if value != value:  # NaN
+            return None
+        return value
+
+    def set_value(self, index: int, field: str, value) -> None:
+        if field == "type":
+            value = particle_type_codes[value]
+        elif value is None:
+            value = np.nan
+        self._data[field][index] = value
+        self.version += 1
+
+    def row_dict(self, index: int) -> Dict:
+        return {field: self.get_value(index, field) for field in particle_fields}
+
+    def save(self, file: Path) -> None:
+        tmpfile = file.with_suffix(".tmp.npy")
+        np.save(tmpfile, self.data)
+        os.replace(tmpfile, file)
+
+    @classmethod
+    def load(cls, file: Path) -> "ParticleStore":
+        data = np.load(file)
+        self = cls(capacity=max(len(data), 64))
+        self._data[:len(data)] = data
+        self._size = len(data)
+        self._index = {int(hash): index for index, hash in enumerate(data["hash"])}
+        return self
+
+    @classmethod
+    def from_dicts(cls, pdata: Dict) -> "ParticleStore":
+        self = cls(capacity=max(len(pdata), 64))
+        for k, v in pdata.items():
+            self[int(k)] = ParticleData(**v)
+        return self
+
+
 @dataclass
 class Input:
     alpha: float
@@ -84,35 +261,220 @@ class Meta:
     git_hash: str = None
     rebound_hash: str = None
     massloss_method: str = None
+    massloss_table: str = None  # only for the tabulated method
+    massloss_cache_tolerance: float = None  # None disables the cache
+    massloss_cache_size: int = None
+    massloss_cache_hits: int = None
+    massloss_cache_misses: int = None
     no_merging: bool = None
+    heartbeat_checks: int = None
+    heartbeat_orbits_computed: int = None
+    energy_interval: int = None  # steps between energy log entries
+    energy_active_only_above: int = None
+    energy_evaluations: int = None
+    energy_time: float = None  # cpu seconds spent calculating the energy
 
     def save(self):
         return self.__dict__
 
 
+@dataclass
+class MassBudget:
+    """
+    mass and water mass of the original bodies that ended up in one body compared to that body
+    """
+    initial_mass: float
+    initial_water_mass: float
+    final_mass: float
+    final_water_mass: float
+
+    @property
+    def lost_mass(self) -> float:
+        return self.initial_mass - self.final_mass
+
+    @property
+    def lost_water_mass(self) -> float:
+        return self.initial_water_mass - self.final_water_mass
+
+
 class CollisionTree:
+    """
+    all collisions indexed by the hash of the resulting body
+
+    Additionally, the child of every body that took part in a collision is indexed,
+    so that ancestry and descendant queries don't need to look at all collisions.
+    Results of the queries are cached until the next collision is added,
+    results that also depend on the particle data only as long as that doesn't change either.
+    """
+
     def __init__(self):
         self._tree = {}
+        self._children: Dict[int, int] = {}
+        self._cache: Dict[Tuple, object] = {}
+        self._pdata_cache: Dict[Tuple, object] = {}
+        self._pdata_cache_source: Optional[Tuple["ParticleStore", int]] = None
 
     def add(self, source1: Particle, source2: Particle, to: Particle, metadata: CollisionMeta):
         data = {"parents": [source1.hash.value, source2.hash.value], "meta": metadata}
         self._tree[to.hash.value] = data
+        self._index(to.hash.value, data)
+        self._clear_cache()
+
+    def _clear_cache(self) -> None:
+        self._cache.clear()
+        self._pdata_cache.clear()
+
+    def _cache_for(self, pdata: "ParticleStore") -> Dict[Tuple, object]:
+        """
+        the cache of results computed from this pdata (emptied if it is another store or has changed since)
+        """
+        source = self._pdata_cache_source
+        if source is None or source[0] is not pdata or source[1] != pdata.version:
+            self._pdata_cache.clear()
+            self._pdata_cache_source = (pdata, pdata.version)
+        return self._pdata_cache
+
+    def _index(self, key: int, data: Dict) -> None:
+        for parent in data["parents"]:
+            self._children[parent] = key
+
+    def parents(self, hash: int) -> Optional[List[int]]:
+        """
+        the two bodies that merged into this one (None if it is an original body)
+        """
+        if hash not in self._tree:
+            return None
+        return self._tree[hash]["parents"]
+
+    def child(self, hash: int) -> Optional[int]:
+        """
+        the body this one merged into (None if it never collided afterwards)
+        """
+        return self._children.get(hash)
+
+    def descendant(self, hash: int) -> int:
+        """
+        the body this one finally ended up in (itself if it never collided)
+        """
+        while hash in self._children:
+            hash = self._children[hash]
+        return hash
+
+    def ancestors(self, hash: int) -> FrozenSet[int]:
+        """
+        all bodies that merged (directly or indirectly) into this one
+        """
+        key = ("ancestors", hash)
+        if key not in self._cache:
+            # explicit stack, as long merge chains would exceed the recursion limit
+            result = set()
+            stack = [hash]
+            while stack:
+                for parent in self.parents(stack.pop()) or []:
+                    if parent not in result:
+                        result.add(parent)
+                        stack.append(parent)
+            self._cache[key] = frozenset(result)
+        return self._cache[key]
+
+    def original_bodies(self, hash: int) -> FrozenSet[int]:
+        """
+        the bodies from the initial conditions that form this one
+        """
+        if hash not in self._tree:
+            return frozenset([hash])
+        return frozenset(ancestor for ancestor in self.ancestors(hash) if ancestor not in self._tree)
+
+    def main_lineage(self, hash: int, pdata: "ParticleStore") -> List[int]:
+        """
+        this body, the more massive of its two parents, the more massive parent of that one, ...
+        down to an original body
+        """
+        key = ("lineage", hash)
+        cache = self._cache_for(pdata)
+        if key not in cache:
+            lineage = [hash]
+            while hash in self._tree:
+                parent1, parent2 = self._tree[hash]["parents"]
+                hash = parent1 if pdata[parent1].total_mass > pdata[parent2].total_mass else parent2
+                lineage.append(hash)
+            cache[key] = lineage
+        return cache[key]
+
+    def mass_budget(self, hash: int, pdata: "ParticleStore") -> MassBudget:
+        key = ("budget", hash)
+        cache = self._cache_for(pdata)
+        if key not in cache:
+            initial_mass = initial_water_mass = 0
+            for original in self.original_bodies(hash):
+                initial_mass += pdata[original].total_mass
+                initial_water_mass += pdata[original].water_mass
+            final = pdata[hash]
+            cache[key] = MassBudget(initial_mass, initial_water_mass, final.total_mass, final.water_mass)
+        return cache[key]
+
+    def collision_losses(self, pdata: "ParticleStore") -> Tuple[float, float]:
+        """
+        total (mass, water mass) lost in all collisions
+        """
+        key = ("collision_losses",)
+        cache = self._cache_for(pdata)
+        if key not in cache:
+            mass = water_mass = 0
+            for child, data in self._tree.items():
+                for parent in data["parents"]:
+                    mass += pdata[parent].total_mass
+                    water_mass += pdata[parent].water_mass
+                mass -= pdata[child].total_mass
+                water_mass -= pdata[child].water_mass
+            cache[key] = mass, water_mass
+        return cache[key]
+
+    def gas_giant_accretion(self, pdata: "ParticleStore") -> Tuple[float, float]:
+        """
+        total (mass, water mass) of all bodies that collided with a gas giant
+        """
+        key = ("gas_giant_accretion",)
+        cache = self._cache_for(pdata)
+        if key not in cache:
+            mass = water_mass = 0
+            for col_id, data in self._tree.items():
+                gas_giants = [parent for parent in data["parents"] if pdata[parent].type == "gas giant"]
+                if len(gas_giants) > 1:
+                    print(f"it seems like {len(gas_giants)} gas giants collided with each other in {col_id}")
+                    continue
+                if gas_giants:
+                    other_parent = [parent for parent in data["parents"] if parent not in gas_giants][0]
+                    mass += pdata[other_parent].total_mass
+                    water_mass += pdata[other_parent].water_mass
+            cache[key] = mass, water_mass
+        return cache[key]
+
+    def last_collision_time(self) -> float:
+        key = ("last_collision_time",)
+        if key not in self._cache:
+            self._cache[key] = max((data["meta"].time for data in self._tree.values()), default=0)
+        return self._cache[key]
+
+    def save_entry(self, key: int) -> Dict:
+        data = deepcopy(self._tree[key])
+        metadata = data["meta"]
+        metadata = metadata.__dict__
+        if metadata["input"]:
+            metadata["input"] = metadata["input"].__dict__
+            metadata["adjusted_input"] = metadata["adjusted_input"].__dict__
+        data["meta"] = metadata
+        return data
 
     def save(self):
         savetree = {}
-        tmpcopy = deepcopy(self._tree)
-        for key, data in tmpcopy.items():
-            metadata = data["meta"]
-            metadata = metadata.__dict__
-            if metadata["input"]:
-                metadata["input"] = metadata["input"].__dict__
-                metadata["adjusted_input"] = metadata["adjusted_input"].__dict__
-            data["meta"] = metadata
-            savetree[key] = data
+        for key in self._tree.keys():
+            savetree[key] = self.save_entry(key)
         return savetree
 
     def load(self, tree):
         self._tree = {}
+        self._children = {}
         for key, data in tree.items():
             metadata = data["meta"]
             if metadata["input"]:
@@ -122,6 +484,8 @@ class CollisionTree:
             metadata = CollisionMeta(**metadata)
             data["meta"] = metadata
             self._tree[int(key)] = data
+            self._index(int(key), data)
+        self._clear_cache()
 
     def get_tree(self) -> Dict:
         return self._tree
@@ -130,70 +494,359 @@ class CollisionTree:
         return self._tree[particle.hash.value]
 
 
-class History:
-    def __init__(self):
-        self.energy = []
-        self.momentum = []
-        self.total_mass = []
-        self.time = []
-        self.N = []
-        self.N_active = []
+class TimeSeries:
+    """
+    one row per savestep
 
-    def append(self, energy: float, momentum: float, total_mass: float, time: float, N: int, N_active: int):
-        self.energy.append(energy)
-        self.momentum.append(momentum)
-        self.total_mass.append(total_mass)
-        self.time.append(time)
-        self.N.append(N)
-        self.N_active.append(N_active)
+    saved as one raw binary file per column in a directory, new rows are just appended to them
+    and loading gives (memory-mapped) numpy arrays
+    """
+    columns: Dict[str, type] = {}
 
-    def save(self):
-        return self.__dict__
+    def __init__(self):
+        # rows in the column files
+        self._saved_columns: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=dtype) for name, dtype in self.columns.items()
+        }
+        self._num_written = 0
+        # rows that are not yet written, in buffers that grow like the ParticleStore
+        self._new_columns: Dict[str, np.ndarray] = {
+            name: np.empty(64, dtype=dtype) for name, dtype in self.columns.items()
+        }
+        self._num_new = 0
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        if name not in type(self).columns:
+            raise AttributeError(name)
+        saved = self._saved_columns[name]
+        new = self._new_columns[name][:self._num_new]
+        if not self._num_new:
+            return saved
+        if not self._num_written:
+            return new
+        return np.concatenate([saved, new])
+
+    def __len__(self) -> int:
+        return self._num_written + self._num_new
+
+    def _append(self, *row) -> None:
+        if self._num_new == len(self._new_columns["time"]):
+            for name, column in self._new_columns.items():
+                self._new_columns[name] = np.resize(column, 2 * len(column))
+        for name, value in zip(self.columns, row):
+            self._new_columns[name][self._num_new] = value
+        self._num_new += 1
+
+    def save(self, directory: Path) -> None:
+        """
+        append all rows that are not yet written to the column files
+        """
+        directory.mkdir(exist_ok=True)
+        for name, dtype in self.columns.items():
+            with (directory / f"{name}.bin").open("ab") as f:
+                # remove everything after the last complete row (e.g. after a crash while saving)
+                f.truncate(self._num_written * np.dtype(dtype).itemsize)
+                f.write(self._new_columns[name][:self._num_new].tobytes())
+        # the written rows are only kept in the column files
+        self._map_columns(directory, self._num_written + self._num_new)
+        self._num_new = 0
+
+    def _map_columns(self, directory: Path, num_rows: int) -> None:
+        self._num_written = num_rows
+        if not num_rows:
+            return
+        for name, dtype in self.columns.items():
+            self._saved_columns[name] = np.memmap(directory / f"{name}.bin", dtype=dtype, mode="r", shape=(num_rows,))
+
+    def load(self, directory: Path) -> None:
+        self.__init__()
+        # ignore incomplete rows
+        num_rows = min(
+            (directory / f"{name}.bin").stat().st_size // np.dtype(dtype).itemsize
+            for name, dtype in self.columns.items()
+        )
+        self._map_columns(directory, num_rows)
+
+
+class History(TimeSeries):
+    """
+    conserved quantities and number of particles, saved in <run>.history/
+    """
+    columns = {
+        "energy": np.float64,
+        "momentum": np.float64,
+        "total_mass": np.float64,
+        "time": np.float64,
+        "N": np.int64,
+        "N_active": np.int64,
+    }
 
-    def load(self, data):
-        self.__dict__ = data
+    def append(self, energy: float, momentum: float, total_mass: float, time: float, N: int, N_active: int):
+        self._append(energy, momentum, total_mass, time, N, N_active)
+
+    def load_json(self, data: Dict) -> None:
+        """
+        load the old .history.json format (the rows count as not yet saved)
+        """
+        self.__init__()
+        for row in zip(*(data[name] for name in self.columns)):
+            self.append(*row)
+
+
+class IntegratorStats(TimeSeries):
+    """
+    counters of the integrator since the previous savestep, saved in <run>.integratorstats/
+    """
+    columns = {
+        "time": np.float64,
+        "steps": np.int64,
+        # steps in which MERCURIUS integrated some particles with IAS15
+        "encounter_steps": np.int64,
+        # sum of the number of particles in an encounter over all steps
+        "encounter_particle_steps": np.int64,
+        "max_encounter_N": np.int64,
+        "min_dt": np.float64,
+        "collisions": np.int64,
+    }
+
+    def append(self, time: float, steps: int, encounter_steps: int, encounter_particle_steps: int,
+               max_encounter_N: int, min_dt: float, collisions: int):
+        self._append(time, steps, encounter_steps, encounter_particle_steps, max_encounter_N, min_dt, collisions)
+
+
+class Journal:
+    """
+    append-only log of the changes to an ExtraData since the last full .extra.json was written
+
+    Every incremental save appends one line per new or changed particle, one per new collision
+    and one with the current meta, followed by a commit record.
+    When loading, only complete commits are replayed on top of the .extra.json,
+    so a run that crashed while writing the journal loses at most its last savestep.
+    Every commit is tagged with the generation of the .extra.json it belongs to
+    and commits of older generations (left behind by a crash during compaction) are skipped.
+    """
+
+    def __init__(self, filename: Path):
+        self.filename = filename
+        self.saved_pdata = np.zeros(0, dtype=particle_dtype)
+        self.saved_tree: Set[int] = set()
+        self.num_commits = 0
+        # size of the journal up to the last complete commit when it was loaded
+        self.committed_size: Optional[int] = None
+
+    def mark_saved(self, ed: "ExtraData") -> None:
+        self.saved_pdata = ed.pdata.data.copy()
+        self.saved_tree = set(ed.tree.get_tree().keys())
+
+    def changes(self, ed: "ExtraData") -> List[Dict]:
+        records = [{"type": "meta", "data": ed.meta.save()}]
+        current = ed.pdata.data
+        num_saved = len(self.saved_pdata)
+        changed_fields = {}
+        for field in particle_fields:
+            old, new = self.saved_pdata[field], current[field][:num_saved]
+            changed = old != new
+            if new.dtype.kind == "f":
+                changed &= ~(np.isnan(old) & np.isnan(new))
+            changed_fields[field] = changed
+        # e.g. escapes or sun collisions found by the heartbeat
+        for index in np.flatnonzero(np.logical_or.reduce(list(changed_fields.values()))):
+            row = ed.pdata.row_dict(index)
+            records.append({
+                "type": "pdata", "hash": int(current["hash"][index]),
+                "data": {field: row[field] for field in particle_fields if changed_fields[field][index]}
+            })
+        for index in range(num_saved, len(current)):
+            records.append({"type": "pdata", "hash": int(current["hash"][index]), "data": ed.pdata.row_dict(index)})
+        for key in ed.tree.get_tree().keys() - self.saved_tree:
+            records.append({"type": "collision", "hash": key, "data": ed.tree.save_entry(key)})
+        return records
+
+    def append(self, ed: "ExtraData") -> None:
+        records = self.changes(ed)
+        records.append({"type": "commit", "generation": ed.generation})
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with self.filename.open("a") as f:
+            if self.committed_size is not None:
+                # drop the remains of an interrupted save before appending to the journal
+                f.truncate(self.committed_size)
+                self.committed_size = None
+            f.write(lines)
+        self.num_commits += 1
+        self.mark_saved(ed)
+
+    def clear(self) -> None:
+        self.filename.open("w").close()
+        self.num_commits = 0
+        self.committed_size = None
+
+    def committed_meta(self, generation: int) -> Optional[Dict]:
+        """
+        the meta of the last committed save of this (or a newer) generation without parsing the other records
+        """
+        if not self.filename.exists():
+            return None
+        meta = pending = None
+        with self.filename.open("rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # incomplete last record
+                if line.startswith(b'{"type": "meta"'):
+                    pending = line
+                elif line.startswith(b'{"type": "commit"'):
+                    try:
+                        commit = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if pending is not None and commit.get("generation", 0) >= generation:
+                        meta = pending
+                    pending = None
+        return json.loads(meta)["data"] if meta is not None else None
+
+    def replay(self, data: Dict) -> Dict[int, Dict]:
+        """
+        apply all committed records in the journal to the raw (json) data of an .extra.json
+        and return the changes to the particle data (per hash)
+        """
+        self.num_commits = 0
+        self.committed_size = 0
+        pdata_changes = {}
+        if not self.filename.exists():
+            return pdata_changes
+        generation = data.get("generation", 0)
+        pending = []
+        with self.filename.open("rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # incomplete last record
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record["type"] != "commit":
+                    pending.append(record)
+                    continue
+                if record.get("generation", 0) < generation:
+                    pending = []  # already contained in the .extra.json
+                for change in pending:
+                    if change["type"] == "meta":
+                        data["meta"] = change["data"]
+                    elif change["type"] == "pdata":
+                        pdata_changes.setdefault(change["hash"], {}).update(change["data"])
+                    elif change["type"] == "collision":
+                        data["tree"][str(change["hash"])] = change["data"]
+                    else:
+                        raise ValueError(f"unknown journal record: {change['type']}")
+                pending = []
+                self.num_commits += 1
+                self.committed_size = f.tell()
+        return pdata_changes
 
 
 class ExtraData:
+    # number of incremental saves after which the journal is merged into the .extra.json
+    compact_every = 100
 
     def __init__(self):
         self.tree = CollisionTree()
-        self.pdata: Dict[int, ParticleData] = {}
+        self.pdata = ParticleStore()
         self.meta = Meta()
         self.history = History()
+        self.integrator_stats = IntegratorStats()
+        self.journal: Optional[Journal] = None
+        # increased with every full save, see Journal
+        self.generation = 0
 
     def save(self, base_filename: Path):
-        pdata = {}
-        for k, v in self.pdata.items():
-            pdata[k] = v.__dict__
-
-        with base_filename.with_suffix(".extra.json").open("w") as f:
+        """
+        write the full .extra.json (and empty the journal)
+
+        The current state is committed to the journal first, so a crash at any point
+        leaves files that load as exactly this state.
+        """
+        extra_file = base_filename.with_suffix(".extra.json")
+        if self.journal is None:
+            self.journal = Journal(base_filename.with_suffix(".extra.journal"))
+        if extra_file.exists():
+            self.journal.append(self)
+        self.pdata.save(base_filename.with_suffix(".pdata.npy"))
+        self.generation += 1
+        self.write_extra_file(extra_file)
+        self.journal.clear()
+        self.journal.mark_saved(self)
+        self.save_history(base_filename)
+
+    def write_extra_file(self, extra_file: Path) -> None:
+        tmpfile = extra_file.with_suffix(".json.tmp")
+        with tmpfile.open("w") as f:
             json.dump({
+                "generation": self.generation,
                 "meta": self.meta.save(),
-                "pdata": pdata,
                 "tree": self.tree.save(),
             }, f, indent=2)
-        with base_filename.with_suffix(".history.json").open("w") as f:
-            json.dump(self.history.save(), f, indent=2)
+        os.replace(tmpfile, extra_file)
+
+    def save_incremental(self, base_filename: Path):
+        """
+        only append the changes since the last save to the .extra.journal
+        and regularly compact it into the .extra.json
+        """
+        if self.journal is None:
+            self.journal = Journal(base_filename.with_suffix(".extra.journal"))
+        if not base_filename.with_suffix(".extra.json").exists() or self.journal.num_commits >= self.compact_every:
+            self.save(base_filename)
+            return
+        self.journal.append(self)
+        self.save_history(base_filename)
+
+    def save_history(self, base_filename: Path):
+        self.history.save(base_filename.with_suffix(".history"))
+        self.integrator_stats.save(base_filename.with_suffix(".integratorstats"))
+
+    @staticmethod
+    def load_meta(base_filename: Path) -> Meta:
+        """
+        only the meta of a saved run (much faster than loading all of it)
+        """
+        with base_filename.with_suffix(".extra.json").open() as f:
+            data = json.load(f)
+        journal = Journal(base_filename.with_suffix(".extra.journal"))
+        meta = journal.committed_meta(data.get("generation", 0)) or data["meta"]
+        meta.pop("perfect_merging", None)
+        return Meta(**meta)
 
     @classmethod
     def load(cls, base_filename: Path):
         with base_filename.with_suffix(".extra.json").open() as f:
             data = json.load(f)
-        with base_filename.with_suffix(".history.json").open() as f:
-            history = json.load(f)
+        journal = Journal(base_filename.with_suffix(".extra.journal"))
+        pdata_changes = journal.replay(data)
         self = cls()
+        self.generation = data.get("generation", 0)
         if "perfect_merging" in data["meta"]:
             del data["meta"]["perfect_merging"]
         self.meta = Meta(**data["meta"])
         self.history = History()
-        self.history.load(history)
+        if base_filename.with_suffix(".history").exists():
+            self.history.load(base_filename.with_suffix(".history"))
+        else:
+            with base_filename.with_suffix(".history.json").open() as f:
+                self.history.load_json(json.load(f))
+        if base_filename.with_suffix(".integratorstats").exists():
+            self.integrator_stats.load(base_filename.with_suffix(".integratorstats"))
         self.tree.load(data["tree"])
 
-        for k, v in data["pdata"].items():
-            self.pdata[int(k)] = ParticleData(**v)
+        if "pdata" in data:  # old runs store the particle data in the .extra.json
+            self.pdata = ParticleStore.from_dicts(data["pdata"])
+        else:
+            self.pdata = ParticleStore.load(base_filename.with_suffix(".pdata.npy"))
+        for hash, changes in pdata_changes.items():
+            self.pdata.update(hash, changes)
 
+        journal.mark_saved(self)
+        self.journal = journal
         return self
 
-    def pd(self, particle: Particle) -> ParticleData:
+    def pd(self, particle: Particle) -> ParticleView:
         return self.pdata[particle.hash.value]
+
@@ -1,15 +1,18 @@
 from math import isclose
 from os.path import expanduser
-from statistics import mean
+from pathlib import Path
 from typing import List
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from rebound import SimulationArchive, Simulation
+from rebound import Simulation
 from scipy.constants import mega
 
-from extradata import ExtraData, CollisionMeta
+from catalog import unfinished_runs
+from extradata import ExtraData
+from orbit_table import load_orbit_table
+from snapshots import Snapshots
 from utils import filename_from_argv, is_potentially_habitable, Particle, earth_mass, earth_water_mass, \
     habitable_zone_inner, habitable_zone_outer, get_water_cmap, create_figure, add_au_e_label, \
     inner_solar_system_data, is_ci, get_cb_data, initial_saturn_a, initial_jupiter_a
@@ -58,6 +61,9 @@ columns = [
 
 maintable = []
 
+# skips loading the runs the catalog knows to be unfinished, all others are checked below
+unfinished = unfinished_runs(Path("data"))
+
 final_bodies = {}
 
 for name, filepath in methods.items():
@@ -72,6 +78,9 @@ for name, filepath in methods.items():
     for i in range(1, max_num):
         fn = filename_from_argv(filepath.replace("NUM", str(i)))
         print(fn)
+        if fn.name in unfinished:
+            print("not yet finished")
+            continue
         try:
             ed = ExtraData.load(fn)
         except FileNotFoundError as e:
@@ -81,22 +90,12 @@ for name, filepath in methods.items():
             print("not yet finished")
             continue
 
-        sa = SimulationArchive(str(fn.with_suffix(".bin")))
-        last_sim: Simulation = sa[-1]
+        last_sim: Simulation = Snapshots(fn)[-1]
         planets = []
-        a_values_per_planet = {}
-        e_values_per_planet = {}
-        for sim in sa:
-            if sim.t < ed.meta.tmax - 10 * mega:
-                continue
-            for particle in sim.particles[1:]:
-                hash = particle.hash.value
-                orbit = particle.calculate_orbit()
-                if hash not in a_values_per_planet:
-                    a_values_per_planet[hash] = []
-                    e_values_per_planet[hash] = []
-                a_values_per_planet[hash].append(orbit.a)
-                e_values_per_planet[hash].append(orbit.e)
+        orbits = load_orbit_table(fn, ed)
+        last_10_myr = orbits.t >= ed.meta.tmax - 10 * mega
+        mean_a_per_planet = orbits.mean_by_hash("a", last_10_myr)
+        mean_e_per_planet = orbits.mean_by_hash("e", last_10_myr)
         gas_giants = []
         for particle in last_sim.particles:
             particle_data = ed.pd(particle)
@@ -107,8 +106,8 @@ for name, filepath in methods.items():
                 continue
             # print(particle.r * astronomical_unit / earth_radius)
             planets.append(particle)
-            fin_as.append(mean(a_values_per_planet[particle.hash.value]))
-            fin_es.append(mean(e_values_per_planet[particle.hash.value]))
+            fin_as.append(mean_a_per_planet[particle.hash.value])
+            fin_es.append(mean_e_per_planet[particle.hash.value])
             fin_mass.append(particle_data.total_mass)
             fin_core_mass.append(particle_data.total_mass * particle_data.core_mass_fraction)
             fin_wmf.append(particle_data.water_mass_fraction)
@@ -146,54 +145,21 @@ for name, filepath in methods.items():
                 sun_water_mass += particle.water_mass / earth_water_mass
 
         # count mass lost to gas giants
-        gas_giant_mass = 0
-        gas_giant_water_mass = 0
-        for col_id, collision in ed.tree.get_tree().items():
-            gas_parent = None
-            other_parent = None
-            gas_parent_counter = 0
-            for parent in collision["parents"]:
-                if ed.pdata[parent].type == "gas giant":
-                    gas_parent_counter += 1
-                    gas_parent = parent
-                else:
-                    other_parent = parent
-            if gas_parent_counter > 1:
-                print(f"it seems like {gas_parent_counter} gas giants collided with each other in {col_id}")
-                continue
-            if gas_parent:
-                previous_body = ed.pdata[other_parent]
-                gas_giant_mass += previous_body.total_mass / earth_mass
-                gas_giant_water_mass += previous_body.water_mass / earth_water_mass
+        gas_giant_mass, gas_giant_water_mass = ed.tree.gas_giant_accretion(ed.pdata)
+        gas_giant_mass /= earth_mass
+        gas_giant_water_mass /= earth_water_mass
 
         # count mass lost in collisions
-        collision_mass = 0
-        collision_water_mass = 0
-        for col_id, collision in ed.tree.get_tree().items():
-            parent_mass = 0
-            parent_water_mass = 0
-            for parent in collision["parents"]:
-                parent_body = ed.pdata[parent]
-                parent_mass += parent_body.total_mass / earth_mass
-                parent_water_mass += parent_body.water_mass / earth_water_mass
-            child = ed.pdata[col_id]
-            diff = parent_mass - child.total_mass / earth_mass
-            diff_water = parent_water_mass - child.water_mass / earth_water_mass
-            collision_mass += diff
-            collision_water_mass += diff_water
+        collision_mass, collision_water_mass = ed.tree.collision_losses(ed.pdata)
+        collision_mass /= earth_mass
+        collision_water_mass /= earth_water_mass
         if collision_water_mass < 1e-10:
             collision_water_mass = 0
         if collision_mass < 1e-10:
             collision_mass = 0
 
         # last collision time
-
-        last_collision_time = 0
-        for col_id, collision in ed.tree.get_tree().items():
-            meta: CollisionMeta = collision["meta"]
-            if meta.time > last_collision_time:
-                last_collision_time = meta.time
-        last_collision_time /= mega
+        last_collision_time = ed.tree.last_collision_time() / mega
 
         values = [num_planets, num_planets_pot, M_planets, M_planets_pot, M_water, M_water_pot,
                   sun_mass, sun_water_mass, escaped_mass, escaped_water_mass,
@@ -1,30 +1,277 @@
 #include "rebound.h"
 #include <math.h>
+#include <stdio.h>
+#include <time.h>
+#include <stdlib.h>
 
-double min_distance_from_sun_squared = 0;
-double max_distance_from_sun_squared = 0;
+enum hb_event_type {
+    HB_ESCAPE = 0, HB_SUN_COLLISION = 1, HB_WIDE_ORBIT = 2
+};
 
 struct hb_event {
     uint32_t hash;
+    uint32_t type; // enum hb_event_type
+    double time;
+};
+
+// fixed size record of the .energylog.bin file (read by energylog.py)
+struct hb_energy_record {
     double time;
-    unsigned int new;
+    double energy;
+    uint64_t N;
+    uint64_t steps;
+};
+
+struct removal {
+    uint32_t hash;
+    enum hb_event_type reason;
+};
+
+#define HB_ENERGY_CHUNK 256
+
+// All state of the heartbeat of one simulation. It is attached to the simulation as sim->extras,
+// so that several simulations can be integrated in the same process (even at the same time on different threads).
+// The layout has to match HeartbeatContext in heartbeat_context.py.
+struct hb_context {
+    // boundaries
+    double min_distance_from_sun_squared;
+    double max_distance_from_sun_squared;
+    double max_perihelion_distance; // AU, bodies on wider orbits are removed
+    // check the boundaries every check_interval steps (every step if it is 0 or negative)
+    long check_interval;
+    // bodies are only converted into an orbit if the cheap estimate of their perihelion distance
+    // or effective period is within this relative margin of a boundary
+    double screening_margin;
+    // if set to 0, the simulation is synchronized after every single removal (only for benchmarking)
+    int batch_removals;
+
+    // statistics (read and reset from python)
+    long checks; // number of bodies screened
+    long orbits_computed; // number of full orbit calculations
+
+    // integrator statistics since the last savestep (read and reset from python)
+    long steps;
+    long encounter_steps; // steps in which MERCURIUS integrated some particles with IAS15
+    long encounter_particle_steps; // sum of the number of particles in an encounter over all steps
+    long max_encounter_N;
+    double min_dt; // of the main integrator, rebound doesn't expose the IAS15 substeps
+    unsigned long long last_counted_step;
+
+    // ring buffer of events that have not yet been drained by python
+    struct hb_event *events;
+    unsigned long events_capacity;
+    // the buffer grows if it is full, but not beyond this number of events (0 = no limit)
+    unsigned long events_max_capacity;
+    unsigned long events_written; // total number of events added
+    unsigned long events_read; // total number of events drained
+    unsigned long events_overflow; // events that had to be dropped as the buffer was full
+
+    // log the energy every energy_interval steps (0 = only when requested from python)
+    long energy_interval;
+    // if there are more than this number of particles, the potential energy is only calculated between
+    // the active bodies and all particles (O(N * N_active), the interactions between test particles are ignored
+    // as in the integration), 0 = always use reb_tools_energy
+    long energy_active_only_above;
+    // statistics (read and reset from python)
+    long energy_evaluations;
+    double energy_time; // wall clock seconds spent calculating the energy (by this simulation only)
+    // the last calculated energy, so that it is not calculated twice in the same step
+    double last_energy;
+    long last_energy_steps;
+
+    // records are collected and written in chunks of HB_ENERGY_CHUNK
+    struct hb_energy_record energy_buffer[HB_ENERGY_CHUNK];
+    int energy_buffered;
+    FILE *logfile;
+
+    // bodies to be removed after the current heartbeat pass
+    struct removal *removals;
+    int removals_capacity;
+    int num_removals;
 };
 
-struct hb_event hb_escapes[500];
-struct hb_event hb_wide_orbits[500];
-struct hb_event hb_sun_collisions[500];
 
-int hb_escape_index = 0;
-int hb_wide_orbit_index = 0;
-int hb_sun_collision_index = 0;
+size_t hb_context_size(void) {
+    return sizeof(struct hb_context);
+}
+
+
+struct hb_context *create_context(void) {
+    struct hb_context *ctx = calloc(1, sizeof(struct hb_context));
+    if (!ctx) {
+        return NULL;
+    }
+    ctx->max_perihelion_distance = 11.;
+    ctx->check_interval = 100;
+    ctx->screening_margin = 0.05;
+    ctx->batch_removals = 1;
+    ctx->min_dt = INFINITY;
+    ctx->energy_interval = 10000;
+    ctx->last_energy_steps = -1;
+    return ctx;
+}
+
+
+void free_context(struct hb_context *ctx) {
+    if (!ctx) {
+        return;
+    }
+    if (ctx->logfile) {
+        fclose(ctx->logfile);
+    }
+    free(ctx->events);
+    free(ctx->removals);
+    free(ctx);
+}
+
+
+int init_events(struct hb_context *ctx, unsigned long capacity) {
+    free(ctx->events);
+    ctx->events = malloc(capacity * sizeof(struct hb_event));
+    ctx->events_capacity = ctx->events ? capacity : 0;
+    ctx->events_written = ctx->events_read = ctx->events_overflow = 0;
+    return ctx->events != NULL;
+}
+
+
+int grow_events(struct hb_context *ctx) {
+    unsigned long new_capacity = ctx->events_capacity ? 2 * ctx->events_capacity : 64;
+    if (ctx->events_max_capacity && new_capacity > ctx->events_max_capacity) {
+        new_capacity = ctx->events_max_capacity;
+    }
+    if (new_capacity <= ctx->events_capacity) {
+        return 0;
+    }
+    struct hb_event *new_events = malloc(new_capacity * sizeof(struct hb_event));
+    if (!new_events) {
+        return 0;
+    }
+    // unwrap the unread events to the beginning of the new buffer
+    unsigned long num_unread = ctx->events_written - ctx->events_read;
+    for (unsigned long i = 0; i < num_unread; i++) {
+        new_events[i] = ctx->events[(ctx->events_read + i) % ctx->events_capacity];
+    }
+    free(ctx->events);
+    ctx->events = new_events;
+    ctx->events_capacity = new_capacity;
+    ctx->events_read = 0;
+    ctx->events_written = num_unread;
+    return 1;
+}
+
+
+void add_event(struct hb_context *ctx, uint32_t hash, enum hb_event_type type, double time) {
+    if (ctx->events_written - ctx->events_read == ctx->events_capacity && !grow_events(ctx)) {
+        ctx->events_overflow++;
+        return;
+    }
+    struct hb_event *event = &ctx->events[ctx->events_written % ctx->events_capacity];
+    event->hash = hash;
+    event->type = type;
+    event->time = time;
+    ctx->events_written++;
+}
+
+
+struct hb_event *drain_events(struct hb_context *ctx, unsigned long *count) {
+// Returns the next contiguous block of unread events and stores its length in count
+// (0 if there are none left). As the buffer can wrap around, this needs to be called until count is 0.
+// The events stay valid until the next integration step.
+    unsigned long num_unread = ctx->events_written - ctx->events_read;
+    if (!num_unread) {
+        *count = 0;
+        return ctx->events;
+    }
+    unsigned long start = ctx->events_read % ctx->events_capacity;
+    unsigned long until_end = ctx->events_capacity - start;
+    *count = num_unread < until_end ? num_unread : until_end;
+    ctx->events_read += *count;
+    return ctx->events + start;
+}
+
+
+int init_logfile(struct hb_context *ctx, char *filename) {
+    if (ctx->logfile) {
+        fclose(ctx->logfile);
+    }
+    ctx->logfile = fopen(filename, "ab");
+    ctx->energy_buffered = 0;
+    return ctx->logfile != NULL;
+}
+
+
+int flush_energylog(struct hb_context *ctx) {
+// writes all buffered records to the file (called from python after every savestep and at the end)
+    if (!ctx->logfile) {
+        return 0;
+    }
+    size_t written = fwrite(ctx->energy_buffer, sizeof(struct hb_energy_record), ctx->energy_buffered,
+                            ctx->logfile);
+    int complete = written == (size_t) ctx->energy_buffered;
+    ctx->energy_buffered = 0;
+    return fflush(ctx->logfile) == 0 && complete;
+}
+
+
+double active_energy(struct reb_simulation *sim) {
+// Total energy without the potential between test particles (which don't attract each other in the integration).
+// Same as reb_tools_energy with testparticle_type = 1 (as in water_sim.py), but independent of it.
+    const struct reb_particle *const particles = sim->particles;
+    const int N = sim->N - sim->N_var;
+    const int N_active = (sim->N_active == -1) ? N : sim->N_active;
+    double e_kin = 0;
+    double e_pot = 0;
+    for (int i = 0; i < N; i++) {
+        struct reb_particle p = particles[i];
+        e_kin += 0.5 * p.m * (p.vx * p.vx + p.vy * p.vy + p.vz * p.vz);
+    }
+    for (int i = 0; i < N_active; i++) {
+        for (int j = i + 1; j < N; j++) {
+            const double dx = particles[i].x - particles[j].x;
+            const double dy = particles[i].y - particles[j].y;
+            const double dz = particles[i].z - particles[j].z;
+            e_pot -= sim->G * particles[i].m * particles[j].m / sqrt(dx * dx + dy * dy + dz * dz);
+        }
+    }
+    // energy lost in mergers
+    return e_kin + e_pot + sim->energy_offset;
+}
+
+
+double wall_time(void) {
+// clock() would be the cpu time of the whole process, including other simulations running in it
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (double) now.tv_sec + (double) now.tv_nsec * 1e-9;
+}
 
-int needs_synchronize = 0;
 
-FILE *logfile;
+double track_energy(struct reb_simulation *sim) {
+// Returns the energy of the current step and adds it to the energy log.
+// The energy is only calculated once per step, so the heartbeat and python share the result.
+    struct hb_context *ctx = sim->extras;
+    if (sim->steps_done == (unsigned long long) ctx->last_energy_steps) {
+        return ctx->last_energy;
+    }
+    double start = wall_time();
+    if (ctx->energy_active_only_above && sim->N > ctx->energy_active_only_above) {
+        ctx->last_energy = active_energy(sim);
+    } else {
+        ctx->last_energy = reb_tools_energy(sim);
+    }
+    ctx->energy_time += wall_time() - start;
+    ctx->energy_evaluations++;
+    ctx->last_energy_steps = (long) sim->steps_done;
 
-void init_logfile(char *filename) {
-    FILE *f = fopen(filename, "a");
-    logfile = f;
+    struct hb_energy_record *record = &ctx->energy_buffer[ctx->energy_buffered++];
+    record->time = sim->t;
+    record->energy = ctx->last_energy;
+    record->N = sim->N;
+    record->steps = sim->steps_done;
+    if (ctx->energy_buffered == HB_ENERGY_CHUNK) {
+        flush_energylog(ctx);
+    }
+    return ctx->last_energy;
 }
 
 double elliptical_orbit_velocity(struct reb_simulation *sim, double m0, double m1, double a, double r)
@@ -36,62 +283,135 @@ double elliptical_orbit_velocity(struct reb_simulation *sim, double m0, double m
 }
 
 
+int needs_orbit(struct hb_context *ctx, struct reb_simulation *sim, struct reb_particle p,
+                struct reb_particle primary) {
+// Cheap screening of a body: estimates the perihelion distance and the effective orbital period
+// from the energy and angular momentum relative to the primary (no trigonometry as in reb_tools_particle_to_orbit)
+// and returns 1 if the body could be close to one of the boundaries that need the full orbit.
+    const double mu = sim->G * (p.m + primary.m);
+    const double dx = p.x - primary.x;
+    const double dy = p.y - primary.y;
+    const double dz = p.z - primary.z;
+    const double dvx = p.vx - primary.vx;
+    const double dvy = p.vy - primary.vy;
+    const double dvz = p.vz - primary.vz;
+    const double d = sqrt(dx * dx + dy * dy + dz * dz);
+    const double v_squared = dvx * dvx + dvy * dvy + dvz * dvz;
+    const double hx = dy * dvz - dz * dvy;
+    const double hy = dz * dvx - dx * dvz;
+    const double hz = dx * dvy - dy * dvx;
+    const double h_squared = hx * hx + hy * hy + hz * hz;
+    const double energy = v_squared / 2. - mu / d;
+    if (energy >= 0) {
+        return 0; // unbound: only the distance check applies
+    }
+    const double e_squared = 1. + 2. * energy * h_squared / (mu * mu);
+    const double e = e_squared > 0 ? sqrt(e_squared) : 0;
+    const double perihelion_dist = h_squared / (mu * (1. + e));
+    const double a = -mu / (2. * energy);
+    const double lower = 1. + ctx->screening_margin;
+    const double upper = 1. - ctx->screening_margin;
+    if (perihelion_dist * perihelion_dist < ctx->min_distance_from_sun_squared * lower * lower) {
+        return 1;
+    }
+    if (perihelion_dist > ctx->max_perihelion_distance * upper) {
+        return 1;
+    }
+    double perihelion_vel = elliptical_orbit_velocity(sim, primary.m, p.m, a, perihelion_dist);
+    double T_eff = 2.0 * M_PI * perihelion_dist / perihelion_vel;
+    return T_eff < sim->dt * 20 * lower;
+}
+
+
+void schedule_removal(struct hb_context *ctx, uint32_t hash, enum hb_event_type reason) {
+    if (ctx->num_removals == ctx->removals_capacity) {
+        ctx->removals_capacity = ctx->removals_capacity ? 2 * ctx->removals_capacity : 64;
+        ctx->removals = realloc(ctx->removals, ctx->removals_capacity * sizeof(struct removal));
+    }
+    ctx->removals[ctx->num_removals].hash = hash;
+    ctx->removals[ctx->num_removals].reason = reason;
+    ctx->num_removals++;
+}
+
+
+void synchronize_after_removal(struct reb_simulation *sim) {
+    reb_move_to_com(sim);
+    reb_integrator_synchronize(sim);
+    sim->ri_mercurius.recalculate_coordinates_this_timestep = 1;
+    sim->ri_mercurius.recalculate_dcrit_this_timestep = 1;
+}
+
+
+void apply_removals(struct hb_context *ctx, struct reb_simulation *sim) {
+    for (int i = 0; i < ctx->num_removals; i++) {
+        struct removal r = ctx->removals[i];
+        reb_remove_by_hash(sim, r.hash, 1);
+        add_event(ctx, r.hash, r.reason, sim->t);
+        if (!ctx->batch_removals) {
+            synchronize_after_removal(sim);
+        }
+    }
+    if (ctx->batch_removals && ctx->num_removals) {
+        // one synchronization for all bodies removed in this pass
+        synchronize_after_removal(sim);
+    }
+    ctx->num_removals = 0;
+}
+
+
+void count_step(struct hb_context *ctx, struct reb_simulation *sim) {
+    if (sim->steps_done == ctx->last_counted_step) {
+        return; // the heartbeat is also called at the start of every integration
+    }
+    ctx->last_counted_step = sim->steps_done;
+    ctx->steps++;
+    if (sim->dt_last_done < ctx->min_dt) {
+        ctx->min_dt = sim->dt_last_done;
+    }
+    // the star is always part of the encounter map
+    long encounter_N = (long) sim->ri_mercurius.encounterN - 1;
+    if (encounter_N > 0) {
+        ctx->encounter_steps++;
+        ctx->encounter_particle_steps += encounter_N;
+        if (encounter_N > ctx->max_encounter_N) {
+            ctx->max_encounter_N = encounter_N;
+        }
+    }
+}
+
+
 void heartbeat(struct reb_simulation *sim) {
-    if ((sim->steps_done % 100) == 0) {
+    struct hb_context *ctx = sim->extras;
+    count_step(ctx, sim);
+    if (ctx->check_interval <= 0 || (sim->steps_done % ctx->check_interval) == 0) {
         const struct reb_particle *const particles = sim->particles;
         int N = sim->N - sim->N_var;
         for (int i = 1; i < N; i++) { // skip sun
             struct reb_particle p = particles[i];
             double distance_squared = p.x * p.x + p.y * p.y + p.z * p.z;
+            ctx->checks++;
+            if (distance_squared <= ctx->max_distance_from_sun_squared &&
+                distance_squared >= ctx->min_distance_from_sun_squared &&
+                !needs_orbit(ctx, sim, p, particles[0])) {
+                continue;
+            }
+            ctx->orbits_computed++;
             struct reb_orbit tmp_orbit = reb_tools_particle_to_orbit(sim->G, p, sim->particles[0]);
             double perihelion_dist = tmp_orbit.a * (1.0 - tmp_orbit.e);
-            if (distance_squared > max_distance_from_sun_squared) {
+            if (distance_squared > ctx->max_distance_from_sun_squared) {
                 printf("remove %u at t=%f (max)\n", p.hash, sim->t);
-                reb_remove_by_hash(sim, p.hash, 1);
-                hb_escapes[hb_escape_index].hash = p.hash;
-                hb_escapes[hb_escape_index].time = sim->t;
-                hb_escapes[hb_escape_index].new = 1;
-
-                hb_escape_index++;
-                needs_synchronize = 1;
-            } else if (distance_squared < min_distance_from_sun_squared ||
+                schedule_removal(ctx, p.hash, HB_ESCAPE);
+            } else if (distance_squared < ctx->min_distance_from_sun_squared ||
                        (tmp_orbit.e < 1.0 &&
                         perihelion_dist * perihelion_dist <
-                        min_distance_from_sun_squared)
+                        ctx->min_distance_from_sun_squared)
                     ) {
                 printf("remove %u at t=%f (min)\n", p.hash, sim->t);
-                double mass = p.m;
-                reb_remove_by_hash(sim, p.hash, 1);
-                hb_sun_collisions[hb_sun_collision_index].hash = p.hash;
-                hb_sun_collisions[hb_sun_collision_index].time = sim->t;
-                hb_sun_collisions[hb_sun_collision_index].new = 1;
-
-                // add mass of deleted particle to sun
-                struct reb_particle sun = sim->particles[0];
-                sun.m += mass;
-
-                hb_sun_collision_index++;
-                needs_synchronize = 1;
-            } else if (tmp_orbit.e < 1.0 && perihelion_dist > 11.) {
+                schedule_removal(ctx, p.hash, HB_SUN_COLLISION);
+            } else if (tmp_orbit.e < 1.0 && perihelion_dist > ctx->max_perihelion_distance) {
                 // remove bodies if their perihel distance is above 11AU
                 printf("remove %u at t=%f (max)\n", p.hash, sim->t);
-                reb_remove_by_hash(sim, p.hash, 1);
-                hb_wide_orbits[hb_wide_orbit_index].hash = p.hash;
-                hb_wide_orbits[hb_wide_orbit_index].time = sim->t;
-                hb_wide_orbits[hb_wide_orbit_index].new = 1;
-
-                hb_escape_index++;
-                needs_synchronize = 1;
-            }
-
-            if (needs_synchronize) {
-                printf("distance: %f\n", sqrt(distance_squared));
-                needs_synchronize = 0;
-                N--;
-                reb_move_to_com(sim);
-                reb_integrator_synchronize(sim);
-                sim->ri_mercurius.recalculate_coordinates_this_timestep = 1;
-                sim->ri_mercurius.recalculate_dcrit_this_timestep = 1;
+                schedule_removal(ctx, p.hash, HB_WIDE_ORBIT);
             } else {
                 double perihelion_vel = elliptical_orbit_velocity(
                         sim,
@@ -101,10 +421,13 @@ void heartbeat(struct reb_simulation *sim) {
                 if (T_eff < sim->dt * 20) {
                     printf("Warning: effective orbital period too low (%f < %f)\n", T_eff, sim->dt * 20);
                 }
+                continue;
             }
+            printf("distance: %f\n", sqrt(distance_squared));
         }
+        apply_removals(ctx, sim);
     }
-    if ((sim->steps_done % 10000) == 0) { // ~ every 100 years
-        fprintf(logfile, "%f, %f\n", sim->t, reb_tools_energy(sim));
+    if (ctx->energy_interval && (sim->steps_done % ctx->energy_interval) == 0) { // ~ every 100 years
+        track_energy(sim);
     }
 }
@@ -0,0 +1,178 @@
+"""
+python side of the heartbeat library (heartbeat/heartbeat.c)
+
+All state of the heartbeat lives in a struct hb_context that is attached to its simulation as sim.extras,
+so several simulations can be integrated in one process (also at the same time on different threads)
+while sharing the loaded library.
+"""
+from ctypes import Structure, c_double, c_long, c_int, c_ulong, c_ulonglong, c_uint32, c_uint64, c_void_p, \
+    c_char_p, c_size_t, c_char, POINTER, byref, cast, cdll, sizeof, CDLL
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+from rebound import Simulation
+from rebound.simulation import POINTER_REB_SIM
+
+from utils import check_heartbeat_needs_recompile
+
+# struct hb_event in heartbeat.c
+hb_event_dtype = np.dtype([("hash", np.uint32), ("type", np.uint32), ("time", np.float64)], align=True)
+HB_ESCAPE, HB_SUN_COLLISION, HB_WIDE_ORBIT = range(3)
+
+HB_ENERGY_CHUNK = 256
+
+
+class HeartbeatEvent(Structure):
+    _fields_ = [("hash", c_uint32),
+                ("type", c_uint32),
+                ("time", c_double)]
+
+
+class EnergyRecord(Structure):
+    _fields_ = [("time", c_double),
+                ("energy", c_double),
+                ("N", c_uint64),
+                ("steps", c_uint64)]
+
+
+class HeartbeatContext(Structure):
+    """
+    struct hb_context in heartbeat.c (the order of the fields has to match)
+    """
+    _fields_ = [("min_distance_from_sun_squared", c_double),
+                ("max_distance_from_sun_squared", c_double),
+                ("max_perihelion_distance", c_double),
+                ("check_interval", c_long),
+                ("screening_margin", c_double),
+                ("batch_removals", c_int),
+                ("checks", c_long),
+                ("orbits_computed", c_long),
+                ("steps", c_long),
+                ("encounter_steps", c_long),
+                ("encounter_particle_steps", c_long),
+                ("max_encounter_N", c_long),
+                ("min_dt", c_double),
+                ("last_counted_step", c_ulonglong),
+                ("events", POINTER(HeartbeatEvent)),
+                ("events_capacity", c_ulong),
+                ("events_max_capacity", c_ulong),
+                ("events_written", c_ulong),
+                ("events_read", c_ulong),
+                ("events_overflow", c_ulong),
+                ("energy_interval", c_long),
+                ("energy_active_only_above", c_long),
+                ("energy_evaluations", c_long),
+                ("energy_time", c_double),
+                ("last_energy", c_double),
+                ("last_energy_steps", c_long),
+                ("energy_buffer", EnergyRecord * HB_ENERGY_CHUNK),
+                ("energy_buffered", c_int),
+                ("logfile", c_void_p),
+                ("removals", c_void_p),
+                ("removals_capacity", c_int),
+                ("num_removals", c_int)]
+
+
+_check_interval_field = HeartbeatContext.check_interval
+
+
+def _set_check_interval(context: HeartbeatContext, value: int) -> None:
+    if value < 1:
+        raise ValueError(f"check_interval must be at least 1, not {value}")
+    _check_interval_field.__set__(context, value)
+
+
+HeartbeatContext.check_interval = property(_check_interval_field.__get__, _set_check_interval)
+
+
+@lru_cache(maxsize=None)
+def load_heartbeat() -> CDLL:
+    """
+    loads the heartbeat library once per process
+    """
+    check_heartbeat_needs_recompile()
+    clibheartbeat = cdll.LoadLibrary("heartbeat/heartbeat.so")
+    clibheartbeat.hb_context_size.restype = c_size_t
+    if clibheartbeat.hb_context_size() != sizeof(HeartbeatContext):
+        raise RuntimeError("HeartbeatContext doesn't match struct hb_context in heartbeat.c")
+    context_p = POINTER(HeartbeatContext)
+    clibheartbeat.create_context.restype = context_p
+    clibheartbeat.free_context.argtypes = [context_p]
+    clibheartbeat.init_events.argtypes = [context_p, c_ulong]
+    clibheartbeat.drain_events.argtypes = [context_p, POINTER(c_ulong)]
+    clibheartbeat.drain_events.restype = c_void_p
+    clibheartbeat.init_logfile.argtypes = [context_p, c_char_p]
+    clibheartbeat.flush_energylog.argtypes = [context_p]
+    clibheartbeat.track_energy.argtypes = [POINTER_REB_SIM]
+    clibheartbeat.track_energy.restype = c_double
+    return clibheartbeat
+
+
+class Heartbeat:
+    """
+    the heartbeat of one simulation with its own boundaries, statistics, event buffer and energy log
+    """
+
+    def __init__(self, event_capacity: int = 1024, logfile: Path = None):
+        self._context_p = None
+        self.clib = load_heartbeat()
+        self._context_p = self.clib.create_context()
+        if not self._context_p:
+            raise MemoryError("could not allocate heartbeat context")
+        self.context: HeartbeatContext = self._context_p.contents
+        if not self.clib.init_events(self._context_p, event_capacity):
+            raise MemoryError("could not allocate heartbeat event buffer")
+        if logfile is not None and not self.clib.init_logfile(self._context_p, str(logfile).encode()):
+            raise OSError(f"could not open {logfile}")
+
+    def attach(self, sim: Simulation) -> None:
+        # the context must stay alive as long as the simulation is integrated
+        self.sim = sim
+        sim.extras = cast(self._context_p, c_void_p).value
+        sim.heartbeat = self.clib.heartbeat
+
+    def __del__(self):
+        # also closes the energy log
+        if self._context_p:
+            self.clib.free_context(self._context_p)
+            self._context_p = None
+
+    def drain_events(self) -> np.ndarray:
+        """
+        returns all events added by the heartbeat since the last call
+
+        The result is a view into the C ring buffer (unless the new events wrap around its end),
+        so it is only valid until the simulation is integrated further.
+        """
+        count = c_ulong()
+        blocks = []
+        while True:
+            address = self.clib.drain_events(self._context_p, byref(count))
+            if not count.value:
+                break
+            buffer = (c_char * (count.value * hb_event_dtype.itemsize)).from_address(address)
+            blocks.append(np.frombuffer(buffer, dtype=hb_event_dtype))
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=hb_event_dtype)
+
+    def read_integrator_stats(self) -> Dict[str, float]:
+        """
+        returns the integrator counters since the last call and resets them
+        """
+        ctx = self.context
+        stats = {}
+        for name in ["steps", "encounter_steps", "encounter_particle_steps", "max_encounter_N"]:
+            stats[name] = getattr(ctx, name)
+            setattr(ctx, name, 0)
+        stats["min_dt"] = ctx.min_dt
+        ctx.min_dt = float("inf")
+        return stats
+
+    def track_energy(self) -> float:
+        return self.clib.track_energy(byref(self.sim))
+
+    def flush_energylog(self) -> bool:
+        return bool(self.clib.flush_energylog(self._context_p))
@@ -2,3 +2,14 @@ from .base_massloss import *
 from .lei_zhou_massloss import *
 from .rbf_massloss import *
 from .simple_nn_massloss import *
+from .cached_massloss import *
+from .tabulated_massloss import *
+from .remote_massloss import *
+
+
+def __getattr__(name):
+    # LocalRbfMassloss needs scipy at import time, all other estimators (e.g. TabulatedMassloss) can be used without it
+    if name == "LocalRbfMassloss":
+        from .local_rbf_massloss import LocalRbfMassloss
+        return LocalRbfMassloss
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
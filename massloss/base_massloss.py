@@ -1,10 +1,33 @@
 from abc import ABC, abstractmethod
 from typing import Tuple
 
+import numpy as np
+
+m_ceres = 9.393e+20
+m_earth = 5.9722e+24
+
+# the range every input is clamped to in merge.get_mass_fractions before being passed to an estimator
+alpha_range = (0, 60)
+velocity_range = (1, 5)
+projectile_mass_range = (2 * m_ceres, 2 * m_earth)
+gamma_range = (1 / 10, 1)
+
 
 class Massloss(ABC):
     name: str
+    # estimators that don't always return the same result for the same input set this to False
+    deterministic = True
 
     @abstractmethod
     def estimate(self, alpha, velocity, projectile_mass, gamma) -> Tuple[float, float, float]:
         pass
+
+    def estimate_batch(self, inputs: np.ndarray) -> np.ndarray:
+        """
+        takes a Nx4 array of (alpha, velocity, projectile_mass, gamma)
+        and returns a Nx3 array of (water, mantle, core) retentions
+
+        estimators that can do better than calling estimate() per row should override this
+        """
+        inputs = np.atleast_2d(inputs)
+        return np.array([self.estimate(*row) for row in inputs], dtype=np.float64).reshape(-1, 3)
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from math import log10
+from typing import Tuple
+
+from massloss.base_massloss import Massloss
+from massloss.base_massloss import alpha_range, velocity_range, projectile_mass_range, gamma_range
+
+
+class CachedMassloss(Massloss):
+    """
+    memoizes the results of another (deterministic) estimator
+
+    Inputs are quantized to a fraction `tolerance` of the clamped input range
+    (the projectile mass in log space), so that collisions with nearly the same parameters
+    (especially all the ones clamped to the edge of the range) share one estimate.
+    A tolerance of 0 only reuses results for exactly identical inputs.
+    At most `maxsize` results are kept, the least recently used ones are dropped first.
+    """
+
+    def __init__(self, estimator: Massloss, tolerance: float = 0, maxsize: int = 10000):
+        if not estimator.deterministic:
+            raise ValueError(f"{estimator.name} is not deterministic and can't be cached")
+        self.estimator = estimator
+        self.name = estimator.name
+        self.tolerance = tolerance
+        self.maxsize = maxsize
+        self.cache: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._saved_stats = None
+        if tolerance:
+            self.steps = (
+                tolerance * (alpha_range[1] - alpha_range[0]),
+                tolerance * (velocity_range[1] - velocity_range[0]),
+                tolerance * (log10(projectile_mass_range[1]) - log10(projectile_mass_range[0])),
+                tolerance * (gamma_range[1] - gamma_range[0]),
+            )
+
+    def key(self, alpha, velocity, projectile_mass, gamma) -> Tuple:
+        if not self.tolerance:
+            return alpha, velocity, projectile_mass, gamma
+        values = alpha, velocity, log10(projectile_mass), gamma
+        return tuple(round(value / step) for value, step in zip(values, self.steps))
+
+    def estimate(self, alpha, velocity, projectile_mass, gamma) -> Tuple[float, float, float]:
+        key = self.key(alpha, velocity, projectile_mass, gamma)
+        try:
+            result = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            result = self.estimator.estimate(alpha, velocity, projectile_mass, gamma)
+            self.cache[key] = result
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+            return result
+        self.hits += 1
+        self.cache.move_to_end(key)
+        print("using cached mass retention")
+        return result
+
+    def estimate_batch(self, inputs):
+        return self.estimator.estimate_batch(inputs)
+
+    def save_stats(self, meta) -> None:
+        """
+        write the hit/miss counters into the Meta of the simulation
+        (added to the counts of the previous runs if the simulation was continued)
+        """
+        if self._saved_stats is None:
+            self._saved_stats = (meta.massloss_cache_hits or 0, meta.massloss_cache_misses or 0)
+        previous_hits, previous_misses = self._saved_stats
+        meta.massloss_cache_hits = previous_hits + self.hits
+        meta.massloss_cache_misses = previous_misses + self.misses
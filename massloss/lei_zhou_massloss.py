@@ -2,7 +2,7 @@ from typing import Tuple
 
 from numpy.random import default_rng
 
-from . import Massloss
+from .base_massloss import Massloss
 
 
 class LeiZhouMassloss(Massloss):
@@ -13,6 +13,7 @@ class LeiZhouMassloss(Massloss):
     https://arxiv.org/abs/2105.10105
     """
     name = "leizhou"
+    deterministic = False
 
     def __init__(self):
         self.rng = default_rng()
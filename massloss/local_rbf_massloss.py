@@ -0,0 +1,46 @@
+from typing import Tuple
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+
+from massloss.base_massloss import Massloss
+from massloss.rbf_massloss import load_scaled_dataset, dataset_file
+
+
+class LocalRbfMassloss(Massloss):
+    """
+    RBF interpolation using only the k nearest neighbours of every query point
+
+    The dense RbfMassloss solves a NxN system over the whole dataset (O(N²) memory, O(N³) fit),
+    while this only builds a KD-tree over the scaled inputs and solves a small kxk system per query,
+    so memory grows linearly with the size of the dataset.
+    """
+    name = "localrbf"
+
+    def __init__(self, neighbors: int = 50):
+        self.scaler, scaled_data, output_data = load_scaled_dataset(dataset_file)
+        self.interpolator = RBFInterpolator(
+            scaled_data, output_data,
+            neighbors=min(neighbors, len(scaled_data)),
+            kernel="linear"
+        )
+        print("finished loading interpolation dataset")
+
+    def estimate(self, alpha, velocity, projectile_mass, gamma) -> Tuple[float, float, float]:
+        hard_coded_water_mass_fraction = 1e-5  # same workaround as in RbfMassloss
+        testinput = [alpha, velocity, projectile_mass, gamma,
+                     hard_coded_water_mass_fraction, hard_coded_water_mass_fraction]
+        scaled_input = self.scaler.transform_parameters(testinput)
+        water_retention, mantle_retention, core_retention = self.interpolator(np.atleast_2d(scaled_input))[0]
+        return float(water_retention), float(mantle_retention), float(core_retention)
+
+    def estimate_batch(self, inputs: np.ndarray) -> np.ndarray:
+        inputs = np.atleast_2d(inputs)
+        full_input = np.full((len(inputs), 6), 1e-5)
+        full_input[:, :4] = inputs
+        return self.interpolator(self.scaler.transform_data(full_input))
+
+
+if __name__ == '__main__':
+    inter = LocalRbfMassloss()
+    print(inter.estimate(32, 3, 7.6e22, 0.16, ))
@@ -1,6 +1,6 @@
 from typing import Tuple
 
-from massloss import Massloss
+from massloss.base_massloss import Massloss
 
 
 class PerfectMerging(Massloss):
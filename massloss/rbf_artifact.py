@@ -0,0 +1,132 @@
+"""
+on-disk storage for a fitted RBF interpolator
+
+fitting scipy.interpolate.Rbf on the full dataset solves a dense NxN system, which takes a long time
+and is the same for every simulation using the same dataset. So the fitted state (scaler parameters,
+nodes and weights) is written once into a directory of .npy files that is keyed by a hash of the
+dataset content and can be memory-mapped by every later run.
+"""
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+ARTIFACT_VERSION = 2
+
+default_cache_dir = Path("./rbf_cache")
+
+# radial basis functions as defined in scipy.interpolate.Rbf
+kernels = {
+    "linear": lambda r, epsilon: r,
+    "cubic": lambda r, epsilon: r ** 3,
+    "quintic": lambda r, epsilon: r ** 5,
+    "multiquadric": lambda r, epsilon: np.sqrt((r / epsilon) ** 2 + 1),
+    "gaussian": lambda r, epsilon: np.exp(-(r / epsilon) ** 2),
+}
+
+
+def dataset_hash(dataset_file: Path, *extra: Any) -> str:
+    """
+    hash of the dataset content (and any additional settings that change the fit)
+    """
+    h = hashlib.sha256()
+    h.update(f"v{ARTIFACT_VERSION}".encode())
+    for value in extra:
+        h.update(repr(value).encode())
+    with dataset_file.open("rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@dataclass
+class RbfArtifact:
+    nodes: np.ndarray  # N x 6 (scaled training inputs)
+    weights: np.ndarray  # N x 3
+    function: str
+    epsilon: float
+    # parameters of the CustomScaler that transforms the inputs into the space of the nodes
+    scaler_means: np.ndarray  # 6
+    scaler_stds: np.ndarray  # 6
+    dataset_hash: str = None
+
+    def __post_init__(self):
+        if self.function not in kernels:
+            raise ValueError(f"unsupported rbf function: {self.function}")
+        self.kernel = kernels[self.function]
+
+    def __call__(self, scaled_input: np.ndarray) -> np.ndarray:
+        """
+        scaled_input has the shape (6,) or (M, 6), the result (3,) or (M, 3)
+        """
+        scaled_input = np.asarray(scaled_input, dtype=np.float64)
+        if scaled_input.ndim == 1:
+            return self._evaluate(scaled_input)
+        # limit the size of the (M, N, 6) difference array
+        chunksize = max(1, 2 ** 20 // len(self.nodes))
+        result = np.empty((len(scaled_input), self.weights.shape[1]))
+        for start in range(0, len(scaled_input), chunksize):
+            result[start:start + chunksize] = self._evaluate(scaled_input[start:start + chunksize])
+        return result
+
+    def _evaluate(self, scaled_input: np.ndarray) -> np.ndarray:
+        diff = scaled_input[..., np.newaxis, :] - self.nodes
+        r = np.sqrt(np.einsum("...ij,...ij->...i", diff, diff))
+        return self.kernel(r, self.epsilon) @ self.weights
+
+    def save(self, directory: Path) -> None:
+        """
+        writes into a temporary directory first and then renames it,
+        so that parallel runs never see a half-written artifact
+        """
+        tmpdir = directory.with_name(f"{directory.name}.tmp{os.getpid()}")
+        if tmpdir.exists():
+            shutil.rmtree(tmpdir)
+        tmpdir.mkdir(parents=True)
+        np.save(tmpdir / "nodes.npy", np.ascontiguousarray(self.nodes, dtype=np.float64))
+        np.save(tmpdir / "weights.npy", np.ascontiguousarray(self.weights, dtype=np.float64))
+        np.save(tmpdir / "scaler_means.npy", np.asarray(self.scaler_means, dtype=np.float64))
+        np.save(tmpdir / "scaler_stds.npy", np.asarray(self.scaler_stds, dtype=np.float64))
+        with (tmpdir / "meta.json").open("w") as f:
+            json.dump({
+                "version": ARTIFACT_VERSION,
+                "dataset_hash": self.dataset_hash,
+                "function": self.function,
+                "epsilon": self.epsilon,
+            }, f, indent=2)
+        try:
+            tmpdir.rename(directory)
+        except OSError:
+            # another process was faster
+            shutil.rmtree(tmpdir)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["RbfArtifact"]:
+        """
+        returns None if there is no usable artifact in this directory
+        """
+        try:
+            with (directory / "meta.json").open() as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        if meta["version"] != ARTIFACT_VERSION:
+            return None
+        return cls(
+            nodes=np.load(directory / "nodes.npy", mmap_mode="r"),
+            weights=np.load(directory / "weights.npy", mmap_mode="r"),
+            function=meta["function"],
+            epsilon=meta["epsilon"],
+            scaler_means=np.load(directory / "scaler_means.npy"),
+            scaler_stds=np.load(directory / "scaler_stds.npy"),
+            dataset_hash=meta["dataset_hash"],
+        )
+
+
+def artifact_dir(hash: str, cache_dir: Path = default_cache_dir) -> Path:
+    return cache_dir / hash[:32]
@@ -3,9 +3,79 @@ from pathlib import Path
 from typing import Tuple
 
 import numpy as np
-from scipy.interpolate import Rbf
 
-from massloss import Massloss
+from massloss.base_massloss import Massloss
+from massloss.rbf_artifact import RbfArtifact, dataset_hash, artifact_dir, default_cache_dir
+
+dataset_file = Path("./rsmc_dataset.jsonl")
+num_testrun_points = 100
+
+
+def is_testrun() -> bool:
+    # water_sim.py run [run ...] test
+    return len(sys.argv) > 2 and sys.argv[-1] == "test"
+
+
+def load_scaled_dataset(dataset: Path):
+    """
+    returns the fitted scaler, the scaled inputs (N x 6) and the retentions (N x 3)
+    """
+    sys.path.append("./bac")
+
+    from bac.simulation_list import SimulationList
+    from bac.CustomScaler import CustomScaler
+
+    print("loading interpolation dataset")
+    simulations = SimulationList.jsonlines_load(dataset)
+
+    scaler = CustomScaler()
+    scaler.fit(simulations.X)
+
+    scaled_data = scaler.transform_data(simulations.X)
+    output_data = np.array([simulations.Y_water, simulations.Y_mantle, simulations.Y_core]).T
+    return scaler, scaled_data, output_data
+
+
+def fit_artifact(dataset: Path, testrun: bool, hash: str = None) -> RbfArtifact:
+    """
+    the slow part: read the dataset, fit the scaler and solve the dense Rbf system
+    """
+    from scipy.interpolate import Rbf
+
+    scaler, scaled_data, output_data = load_scaled_dataset(dataset)
+    if testrun:
+        # keep memory usage low in tests
+        output_data = output_data[:num_testrun_points]
+        scaled_data = scaled_data[:num_testrun_points]
+    interpolator = Rbf(*scaled_data.T, output_data, function="linear", mode="N-D")
+    print("finished loading interpolation dataset")
+    return RbfArtifact(
+        nodes=interpolator.xi.T,
+        weights=interpolator.nodes,
+        function=interpolator.function,
+        epsilon=interpolator.epsilon,
+        scaler_means=scaler.means,
+        scaler_stds=scaler.stds,
+        dataset_hash=hash,
+    )
+
+
+def load_artifact(dataset: Path = dataset_file, testrun: bool = False,
+                  cache_dir: Path = default_cache_dir) -> RbfArtifact:
+    """
+    load the fitted interpolator for this dataset from the cache
+    and only fit (and store) it if the dataset changed
+    """
+    hash = dataset_hash(dataset, testrun and num_testrun_points)
+    directory = artifact_dir(hash, cache_dir)
+    artifact = RbfArtifact.load(directory)
+    if artifact is not None and artifact.dataset_hash == hash:
+        print(f"using cached interpolator from {directory}")
+        return artifact
+    artifact = fit_artifact(dataset, testrun, hash)
+    artifact.save(directory)
+    print(f"saved interpolator to {directory}")
+    return RbfArtifact.load(directory)
 
 
 class RbfMassloss(Massloss):
@@ -14,25 +84,16 @@ class RbfMassloss(Massloss):
     def __init__(self):
         sys.path.append("./bac")
 
-        from bac.simulation_list import SimulationList
         from bac.CustomScaler import CustomScaler
 
-        self.testrun = len(sys.argv) > 2 and sys.argv[2] == "test"
+        self.testrun = is_testrun()
 
-        print("loading interpolation dataset")
-        simulations = SimulationList.jsonlines_load(Path("./rsmc_dataset.jsonl"))
+        self.interpolator = load_artifact(dataset_file, self.testrun)
 
+        # the scaler fitted on the dataset, without loading the dataset again
         self.scaler = CustomScaler()
-        self.scaler.fit(simulations.X)
-
-        scaled_data = self.scaler.transform_data(simulations.X)
-        output_data = np.array([simulations.Y_water, simulations.Y_mantle, simulations.Y_core])
-        if self.testrun:
-            # keep memory usage low in tests
-            output_data = output_data[::, :100]
-            scaled_data = scaled_data[:100]
-        self.interpolator = Rbf(*scaled_data.T, output_data.T, function="linear", mode="N-D")
-        print("finished loading interpolation dataset")
+        self.scaler.means = self.interpolator.scaler_means
+        self.scaler.stds = self.interpolator.scaler_stds
 
     def estimate(self, alpha, velocity, projectile_mass, gamma) -> Tuple[float, float, float]:
         hard_coded_water_mass_fraction = 1e-5  # workaround to get proper results for water poor collisions
@@ -42,11 +103,17 @@ class RbfMassloss(Massloss):
         print("# alpha velocity projectile_mass gamma target_water_fraction projectile_water_fraction\n")
         print(" ".join(map(str, testinput)))
 
-        scaled_input = list(self.scaler.transform_parameters(testinput))
-        water_retention, mantle_retention, core_retention = self.interpolator(*scaled_input)
+        scaled_input = self.scaler.transform_parameters(testinput)
+        water_retention, mantle_retention, core_retention = self.interpolator(scaled_input)
         print(mantle_retention, core_retention)
         return float(water_retention), float(mantle_retention), float(core_retention)
 
+    def estimate_batch(self, inputs: np.ndarray) -> np.ndarray:
+        inputs = np.atleast_2d(inputs)
+        full_input = np.full((len(inputs), 6), 1e-5)  # same water mass fraction workaround as above
+        full_input[:, :4] = inputs
+        return self.interpolator(self.scaler.transform_data(full_input))
+
 
 if __name__ == '__main__':
     inter = RbfMassloss()
@@ -1,19 +1,25 @@
 import json
 from dataclasses import dataclass
-from math import exp
 from typing import Tuple, List
 
-from massloss import Massloss
+import numpy as np
 
-Layer = List[float]
+from massloss.base_massloss import Massloss
 
+Layer = np.ndarray
 
-def relu(x):
-    return max(0, x)
 
+def relu(x: np.ndarray) -> np.ndarray:
+    return np.maximum(0, x)
 
-def sigmoid(x):
-    return 1 / (1 + exp(-x))
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):  # exp(-x) -> inf for very negative x, which correctly gives 0
+        return 1 / (1 + np.exp(-x))
+
+
+def as_matrix(values) -> np.ndarray:
+    return np.ascontiguousarray(values, dtype=np.float64)
 
 
 @dataclass
@@ -21,13 +27,28 @@ class Model:
     """
     see https://github.com/Findus23/nn_evaluate
     for more implementations of this model in other languages
+
+    all weights are converted to contiguous float64 arrays once on creation
+    and every layer is evaluated as a matrix product, so the same code handles
+    a single input (shape 6) and a batch of inputs (shape Nx6)
     """
-    means: List[float]  # 6
-    stds: List[float]  # 6
-    hidden_weight: List[List[float]]  # 50x6
-    hidden_bias: List[float]  # 50
-    output_weight: List[List[float]]  # 3x50
-    output_bias: List[float]  # 3
+    means: np.ndarray  # 6
+    stds: np.ndarray  # 6
+    hidden_weight: np.ndarray  # 50x6
+    hidden_bias: np.ndarray  # 50
+    output_weight: np.ndarray  # 3x50
+    output_bias: np.ndarray  # 3
+
+    def __post_init__(self):
+        self.means = as_matrix(self.means)
+        self.stds = as_matrix(self.stds)
+        self.hidden_weight = as_matrix(self.hidden_weight)
+        self.hidden_bias = as_matrix(self.hidden_bias)
+        self.output_weight = as_matrix(self.output_weight)
+        self.output_bias = as_matrix(self.output_bias)
+        # store the transposed weights so that (N x parent) @ (parent x layer) needs no copy
+        self.hidden_weight_t = as_matrix(self.hidden_weight.T)
+        self.output_weight_t = as_matrix(self.output_weight.T)
 
     @property
     def hidden_layer_size(self):
@@ -41,42 +62,24 @@ class Model:
     def output_layer_size(self):
         return len(self.output_bias)
 
-    def calculate_layer(self, layer_size, parent_layer_size, parent_layer, weight, bias) -> Layer:
-        new_layer = []
-        for hl in range(layer_size):
-            node = 0
-            for parent in range(parent_layer_size):
-                node += parent_layer[parent] * weight[hl][parent]
-            node += bias[hl]
-            new_layer.append(node)
-        return new_layer
-
-    def scale_input(self, input: List[float]):
-        result = []
-        for index, parameter in enumerate(input):
-            result.append((parameter - self.means[index]) / self.stds[index])
-        return result
-
-    def evaluate(self, input: List[float]):
-        scaled_input = self.scale_input(input)
-        hidden_layer = self.calculate_layer(
-            layer_size=self.hidden_layer_size,
-            parent_layer_size=self.input_layer_size,
-            parent_layer=scaled_input,
-            weight=self.hidden_weight,
-            bias=self.hidden_bias
-        )
-        hidden_layer = [relu(x) for x in hidden_layer]
-        output_layer = self.calculate_layer(
-            layer_size=self.output_layer_size,
-            parent_layer_size=self.hidden_layer_size,
-            parent_layer=hidden_layer,
-            weight=self.output_weight,
-            bias=self.output_bias
-        )
+    @staticmethod
+    def calculate_layer(parent_layer: Layer, weight_t: np.ndarray, bias: np.ndarray) -> Layer:
+        return parent_layer @ weight_t + bias
+
+    def scale_input(self, input: np.ndarray) -> np.ndarray:
+        return (input - self.means) / self.stds
+
+    def evaluate(self, input: List[float]) -> Layer:
+        return self.evaluate_batch(as_matrix(input))
 
-        output_layer = [sigmoid(x) for x in output_layer]
-        return output_layer
+    def evaluate_batch(self, inputs: np.ndarray) -> Layer:
+        """
+        inputs has the shape (..., 6), the result has the shape (..., 3)
+        """
+        scaled_input = self.scale_input(inputs)
+        hidden_layer = relu(self.calculate_layer(scaled_input, self.hidden_weight_t, self.hidden_bias))
+        output_layer = self.calculate_layer(hidden_layer, self.output_weight_t, self.output_bias)
+        return sigmoid(output_layer)
 
 
 class SimpleNNMassloss(Massloss):
@@ -97,7 +100,15 @@ class SimpleNNMassloss(Massloss):
 
     def estimate(self, alpha, velocity, projectile_mass, gamma) -> Tuple[float, float, float]:
         result = self.model.evaluate([alpha, velocity, projectile_mass, gamma, self.wt, self.wp])
-        return result[0], result[1], result[2]
+        return float(result[0]), float(result[1]), float(result[2])
+
+    def estimate_batch(self, inputs: np.ndarray) -> np.ndarray:
+        inputs = np.atleast_2d(as_matrix(inputs))
+        full_input = np.empty((len(inputs), self.model.input_layer_size))
+        full_input[:, :4] = inputs
+        full_input[:, 4] = self.wt
+        full_input[:, 5] = self.wp
+        return self.model.evaluate_batch(full_input)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,54 @@
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+from massloss.base_massloss import Massloss
+
+default_table_file = Path("./massloss_table.npz")
+
+
+class TabulatedMassloss(Massloss):
+    """
+    multilinear interpolation in a regular grid of precomputed results of another estimator
+    (see tabulate_massloss.py)
+
+    The grid is uniform in alpha, velocity, log10(projectile_mass) and gamma,
+    so finding the cell of an input is O(1) and only numpy is needed to load and evaluate it.
+    """
+    name = "tabulated"
+
+    def __init__(self, table_file: Path = default_table_file):
+        with np.load(table_file) as data:
+            self.source = str(data["source"])
+            # lower bound and step size of the four grid axes
+            self.start = data["start"].astype(np.float64)
+            self.step = data["step"].astype(np.float64)
+            self.table = np.ascontiguousarray(data["table"], dtype=np.float64)  # (n_alpha, n_v, n_m, n_gamma, 3)
+        self.shape = np.array(self.table.shape[:4])
+        print(f"loaded {'x'.join(map(str, self.shape))} table of {self.source} from {table_file}")
+
+    def estimate(self, alpha, velocity, projectile_mass, gamma) -> Tuple[float, float, float]:
+        water_retention, mantle_retention, core_retention = \
+            self.estimate_batch(np.array([[alpha, velocity, projectile_mass, gamma]]))[0]
+        return float(water_retention), float(mantle_retention), float(core_retention)
+
+    def estimate_batch(self, inputs: np.ndarray) -> np.ndarray:
+        inputs = np.array(np.atleast_2d(inputs), dtype=np.float64)
+        inputs[:, 2] = np.log10(inputs[:, 2])
+        position = (inputs - self.start) / self.step
+        # inputs outside the grid are clamped to its edge
+        index = np.clip(np.floor(position).astype(np.intp), 0, self.shape - 2)
+        fraction = np.clip(position - index, 0, 1)
+
+        result = np.zeros((len(inputs), self.table.shape[-1]))
+        for corner in range(16):
+            offsets = [(corner >> axis) & 1 for axis in range(4)]
+            weight = np.ones(len(inputs))
+            for axis, offset in enumerate(offsets):
+                weight *= fraction[:, axis] if offset else 1 - fraction[:, axis]
+            result += weight[:, np.newaxis] * self.table[
+                index[:, 0] + offsets[0], index[:, 1] + offsets[1],
+                index[:, 2] + offsets[2], index[:, 3] + offsets[3]
+            ]
+        return result
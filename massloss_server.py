@@ -0,0 +1,94 @@
+"""
+loads a mass loss estimator once and serves it to all simulations on this node over a unix socket
+
+Simulations use it automatically (see merge.create_base_estimator) if the socket of their method exists
+and the server has loaded the same estimator, otherwise they load their own copy.
+
+usage: python massloss_server.py rbf [--table file] [--socket file] [test]
+"""
+import argparse
+import json
+import socket
+import socketserver
+from pathlib import Path
+
+import numpy as np
+
+from extradata import Meta
+from massloss import Massloss, massloss_socket, server_description, request_header
+from massloss.remote_massloss import receive_exactly
+from merge import load_estimator
+
+
+class EstimateHandler(socketserver.StreamRequestHandler):
+    server: "MasslossServer"
+
+    def handle(self) -> None:
+        estimator = self.server.estimator
+        self.wfile.write(json.dumps({
+            "description": self.server.description,
+            "name": estimator.name,
+            "deterministic": estimator.deterministic,
+        }).encode() + b"\n")
+        self.wfile.flush()
+        while True:
+            header = self.rfile.read(request_header.size)
+            if not header:
+                return  # the simulation closed the connection
+            (num_rows,) = request_header.unpack(header)
+            inputs = np.frombuffer(receive_exactly(self.rfile, num_rows * 4 * 8), dtype=np.float64).reshape(-1, 4)
+            if num_rows == 1:
+                # exactly the same result as if the simulation had loaded the estimator itself
+                results = np.array([estimator.estimate(*inputs[0])], dtype=np.float64)
+            else:
+                results = estimator.estimate_batch(inputs)
+            self.wfile.write(np.ascontiguousarray(results, dtype=np.float64).tobytes())
+            self.wfile.flush()
+
+
+class MasslossServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_file: Path, estimator: Massloss, description: dict):
+        self.estimator = estimator
+        self.description = description
+        super().__init__(str(socket_file), EstimateHandler)
+
+
+def remove_stale_socket(socket_file: Path) -> None:
+    if not socket_file.exists():
+        return
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(str(socket_file))
+    except ConnectionRefusedError:
+        print(f"removing stale socket {socket_file}")
+        socket_file.unlink()
+        return
+    raise FileExistsError(f"another server is already listening on {socket_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("method", help="name of the massloss method to serve (e.g. rbf)")
+    parser.add_argument("--table", help="table file for the tabulated method")
+    parser.add_argument("--socket", type=Path, help="defaults to the socket the simulations look for")
+    parser.add_argument("test", nargs="?", choices=["test"], help="serve the estimator of test runs")
+    args = parser.parse_args()
+
+    socket_file = args.socket or massloss_socket(args.method)
+    remove_stale_socket(socket_file)
+    estimator = load_estimator(Meta(massloss_method=args.method, massloss_table=args.table))
+    description = server_description(args.method, args.table, args.test == "test")
+    with MasslossServer(socket_file, estimator, description) as server:
+        print(f"serving {estimator.name} on {socket_file}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket_file.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 from copy import copy
+from pathlib import Path
 from pprint import pprint
-from typing import Tuple, Optional
+from threading import Lock
+from typing import Tuple, Dict
 
 import numpy as np
 from numpy import linalg, sqrt
@@ -8,32 +10,89 @@ from rebound import Simulation, Particle
 from rebound.simulation import POINTER_REB_SIM, reb_collision
 from scipy.constants import astronomical_unit, G
 
-from extradata import ExtraData, ParticleData, CollisionMeta, Input
-from massloss import RbfMassloss, Massloss, LeiZhouMassloss, SimpleNNMassloss
+from extradata import ExtraData, ParticleData, CollisionMeta, Input, Meta
+from massloss import RbfMassloss, Massloss, LeiZhouMassloss, SimpleNNMassloss, LocalRbfMassloss, CachedMassloss, \
+    TabulatedMassloss, RemoteMassloss, massloss_socket, server_description
+from massloss.base_massloss import alpha_range, velocity_range, projectile_mass_range, gamma_range
 from massloss.perfect_merging import PerfectMerging
+from massloss.rbf_massloss import is_testrun
 from utils import unique_hash, clamp, PlanetaryRadius
 
-massloss_estimator: Optional[Massloss] = None  # global waterloss estimator cache
-
-
-def get_mass_fractions(input_data: Input) -> Tuple[float, float, float, CollisionMeta]:
-    global massloss_estimator
+# the loaded estimators are read-only, so all simulations in a process can share them
+shared_estimators: Dict[Tuple[str, str], Massloss] = {}
+shared_estimators_lock = Lock()
+
+
+def load_estimator(meta: Meta) -> Massloss:
+    methods = [RbfMassloss, LocalRbfMassloss, LeiZhouMassloss, PerfectMerging, SimpleNNMassloss, TabulatedMassloss]
+    per_name = {}
+    for method in methods:
+        per_name[method.name] = method
+    try:
+        estimator_class = per_name[meta.massloss_method]
+    except KeyError:
+        print("invalid mass loss estimation method")
+        print("please use one of these:")
+        print(per_name)
+        raise
+    if estimator_class is TabulatedMassloss and meta.massloss_table:
+        return estimator_class(Path(meta.massloss_table))
+    return estimator_class()
+
+
+def create_base_estimator(meta: Meta) -> Massloss:
+    """
+    connects to the massloss_server.py of this node if it serves this method
+    and only loads the estimator in this process otherwise
+    """
+    socket_file = massloss_socket(meta.massloss_method)
+    if socket_file.exists():
+        description = server_description(meta.massloss_method, meta.massloss_table, is_testrun())
+        try:
+            return RemoteMassloss(socket_file, description, fallback=lambda: load_estimator(meta))
+        except (OSError, ValueError) as e:
+            print(f"not using the massloss server at {socket_file}: {e}")
+    return load_estimator(meta)
+
+
+def shared_base_estimator(meta: Meta) -> Massloss:
+    """
+    the estimator of the method of the simulation, only loaded once per process
+    """
+    key = (meta.massloss_method, meta.massloss_table)
+    with shared_estimators_lock:
+        if key not in shared_estimators:
+            shared_estimators[key] = create_base_estimator(meta)
+        return shared_estimators[key]
+
+
+def create_massloss_estimator(meta: Meta, shared=False) -> Massloss:
+    """
+    the estimator for a simulation (with its own cache if enabled)
+    """
+    estimator = shared_base_estimator(meta) if shared else create_base_estimator(meta)
+    if meta.massloss_cache_tolerance is not None:
+        if estimator.deterministic:
+            estimator = CachedMassloss(estimator, meta.massloss_cache_tolerance, meta.massloss_cache_size)
+        else:
+            print(f"not caching {estimator.name} as it is not deterministic")
+    return estimator
+
+
+def get_mass_fractions(input_data: Input, estimator: Massloss) -> Tuple[float, float, float, CollisionMeta]:
     print("v_esc", input_data.escape_velocity)
     print("v_orig,v_si", input_data.velocity_original, input_data.velocity_si)
     print("v/v_esc", input_data.velocity_esc)
     data = copy(input_data)
     if data.gamma > 1:
         data.gamma = 1 / data.gamma
-    data.alpha = clamp(data.alpha, 0, 60)
-    data.velocity_esc = clamp(data.velocity_esc, 1, 5)
-
-    m_ceres = 9.393e+20
-    m_earth = 5.9722e+24
-    data.projectile_mass = clamp(data.projectile_mass, 2 * m_ceres, 2 * m_earth)
-    data.gamma = clamp(data.gamma, 1 / 10, 1)
+    data.alpha = clamp(data.alpha, *alpha_range)
+    data.velocity_esc = clamp(data.velocity_esc, *velocity_range)
+    data.projectile_mass = clamp(data.projectile_mass, *projectile_mass_range)
+    data.gamma = clamp(data.gamma, *gamma_range)
 
     water_retention, mantle_retention, core_retention = \
-        massloss_estimator.estimate(data.alpha, data.velocity_esc, data.projectile_mass, data.gamma, )
+        estimator.estimate(data.alpha, data.velocity_esc, data.projectile_mass, data.gamma, )
 
     metadata = CollisionMeta()
     metadata.interpolation_input = [data.alpha, data.velocity_esc, data.projectile_mass, data.gamma]
@@ -54,8 +113,7 @@ def get_mass_fractions(input_data: Input) -> Tuple[float, float, float, Collisio
     return water_retention, mantle_retention, core_retention, metadata
 
 
-def merge_particles(sim_p: POINTER_REB_SIM, collision: reb_collision, ed: ExtraData):
-    global massloss_estimator
+def merge_particles(sim_p: POINTER_REB_SIM, collision: reb_collision, ed: ExtraData, estimator: Massloss):
     print("--------------")
     print("colliding")
     sim: Simulation = sim_p.contents
@@ -124,20 +182,6 @@ def merge_particles(sim_p: POINTER_REB_SIM, collision: reb_collision, ed: ExtraD
 
     print("interpolating")
 
-    if not massloss_estimator:
-        methods = [RbfMassloss, LeiZhouMassloss, PerfectMerging, SimpleNNMassloss]
-        per_name = {}
-        for method in methods:
-            per_name[method.name] = method
-        try:
-            estimator_class = per_name[ed.meta.massloss_method]
-        except KeyError:
-            print("invalid mass loss estimation method")
-            print("please use one of these:")
-            print(per_name)
-            raise
-        massloss_estimator = estimator_class()
-
     # let interpolation calculate water and mass retention fraction
     # meta is just a bunch of intermediate results that will be logged to help
     # understand the collisions better
@@ -151,7 +195,9 @@ def merge_particles(sim_p: POINTER_REB_SIM, collision: reb_collision, ed: ExtraD
         projectile_water_fraction=projectile_wmf,
     )
 
-    water_ret, mantle_ret, core_ret, meta = get_mass_fractions(input_data)
+    water_ret, mantle_ret, core_ret, meta = get_mass_fractions(input_data, estimator)
+    if isinstance(estimator, CachedMassloss):
+        estimator.save_stats(ed.meta)
     print("mass retentions:", water_ret, mantle_ret, core_ret)
 
     meta.collision_velocities = (v1.tolist(), v2.tolist())
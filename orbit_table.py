@@ -0,0 +1,164 @@
+"""
+table of the orbits of all particles in all snapshots of a run (one row per snapshot and particle)
+so that the analysis scripts don't need to deserialize every snapshot of the SimulationArchive again
+
+The table is stored as compressed numpy chunks in <run>.orbits/.
+Every update only adds a chunk with the snapshots that were added to the .bin since the last update
+and the whole table is rebuilt if the .bin was replaced or rewritten (see bin_fingerprint).
+
+usage: python orbit_table.py [runs]
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+from extradata import ExtraData
+from snapshots import Snapshots
+from utils import orbital_elements, ParticleArrays
+
+orbit_table_columns = {
+    "snapshot": np.uint32,
+    "hash": np.uint32,
+    "t": np.float64,
+    "m": np.float64,
+    "a": np.float64,
+    "e": np.float64,
+    "inc": np.float64,
+    "type": np.uint8,  # index in particle_types
+}
+
+
+class OrbitTable:
+    """
+    the columns of the table as numpy arrays (`table.a`, `table.hash`, ...)
+
+    the orbits are in Jacobi coordinates (like Particle.orbit) and the sun is not included
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        if name not in orbit_table_columns:
+            raise AttributeError(name)
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return len(self.columns["hash"])
+
+    def mean_by_hash(self, column: str, mask: np.ndarray = None) -> Dict[int, float]:
+        """
+        average of a column for every particle (optionally only over the rows selected by mask)
+        """
+        hashes = self.hash if mask is None else self.hash[mask]
+        values = self.columns[column] if mask is None else self.columns[column][mask]
+        unique_hashes, inverse = np.unique(hashes, return_inverse=True)
+        means = np.bincount(inverse, weights=values) / np.bincount(inverse)
+        return dict(zip(unique_hashes.tolist(), means.tolist()))
+
+
+def _read_snapshots(snapshots: Snapshots, ed: ExtraData, start: int) -> Dict[str, np.ndarray]:
+    arrays = ParticleArrays()
+    chunks = {name: [] for name in orbit_table_columns}
+    for snapshot in range(start, len(snapshots)):
+        sim = snapshots[snapshot]
+        orbits = orbital_elements(sim, arrays.update(sim), jacobi=True)
+        chunks["snapshot"].append(np.full(len(orbits), snapshot))
+        chunks["t"].append(np.full(len(orbits), sim.t))
+        for name in ["hash", "m", "a", "e", "inc"]:
+            chunks[name].append(orbits[name])
+        chunks["type"].append(ed.pdata.type[ed.pdata.indices(orbits["hash"].tolist())])
+    return {
+        name: np.concatenate(chunks[name]).astype(dtype) if chunks[name] else np.empty(0, dtype=dtype)
+        for name, dtype in orbit_table_columns.items()
+    }
+
+
+def bin_fingerprint(binfile: Path, stat: os.stat_result, size: int) -> Dict:
+    """
+    identity of the .bin and a checksum of the start and end of its first `size` bytes
+
+    As snapshots are only ever appended, these stay the same as long as the table covers the start of the file,
+    while a restarted run or a restored backup (even of the same or a larger size) changes them.
+    """
+    block = 2 ** 16
+    h = hashlib.sha256()
+    with binfile.open("rb") as f:
+        h.update(f.read(min(block, size)))
+        f.seek(max(size - block, 0))
+        h.update(f.read(size - f.tell()))
+    return {"bin_device": stat.st_dev, "bin_inode": stat.st_ino, "bin_checksum": h.hexdigest()}
+
+
+def update_orbit_table(fn: Path, ed: ExtraData = None) -> None:
+    """
+    add the snapshots that are not yet in the table
+    """
+    directory = fn.with_suffix(".orbits")
+    state_file = directory / "state.json"
+    binfile = fn.with_suffix(".bin")
+    stat = binfile.stat()
+    state = None
+    if state_file.exists():
+        with state_file.open() as f:
+            state = json.load(f)
+        unchanged = stat.st_size == state["bin_size"] and stat.st_mtime_ns == state["bin_mtime"]
+        if unchanged and stat.st_ino == state.get("bin_inode"):
+            return
+        if stat.st_size < state["bin_size"] or bin_fingerprint(binfile, stat, state["bin_size"]) != {
+            key: state.get(key) for key in ["bin_device", "bin_inode", "bin_checksum"]
+        }:
+            # the .bin was replaced (e.g. by a backup or a restart), so the table is no longer valid
+            state = None
+    if state is None:
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir()
+        state = {"num_snapshots": 0, "chunks": []}
+
+    if ed is None:
+        ed = ExtraData.load(fn)
+    snapshots = Snapshots(fn)
+    start = state["num_snapshots"]
+    if len(snapshots) > start:
+        chunk = f"{start:06d}.npz"
+        np.savez_compressed(directory / chunk, **_read_snapshots(snapshots, ed, start))
+        state["chunks"].append(chunk)
+        state["num_snapshots"] = len(snapshots)
+    # size and mtime from before reading: if the run continued in the meantime, the next update will add the rest
+    state["bin_size"] = stat.st_size
+    state["bin_mtime"] = stat.st_mtime_ns
+    state.update(bin_fingerprint(binfile, stat, stat.st_size))
+    tmpfile = state_file.with_suffix(".json.tmp")
+    with tmpfile.open("w") as f:
+        json.dump(state, f)
+    tmpfile.replace(state_file)
+
+
+def load_orbit_table(fn: Path, ed: ExtraData = None) -> OrbitTable:
+    """
+    the orbit table of a run (updated first if there are new snapshots)
+    """
+    update_orbit_table(fn, ed)
+    directory = fn.with_suffix(".orbits")
+    with (directory / "state.json").open() as f:
+        state = json.load(f)
+    chunks = [np.load(directory / chunk) for chunk in state["chunks"]]
+    return OrbitTable({
+        name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.empty(0, dtype=dtype)
+        for name, dtype in orbit_table_columns.items()
+    })
+
+
+if __name__ == '__main__':
+    from sys import argv
+
+    from utils import filename_from_argv
+
+    for file in argv[1:]:
+        fn = filename_from_argv(file)
+        table = load_orbit_table(fn)
+        print(f"{fn}: {len(table)} rows from {len(np.unique(table.snapshot))} snapshots")
@@ -4,12 +4,13 @@ from os.path import expanduser
 from pathlib import Path
 from sys import argv
 
+import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
-from rebound import SimulationArchive, Simulation
 
-from extradata import ExtraData
+from extradata import particle_type_codes
+from orbit_table import load_orbit_table
 from utils import filename_from_argv, plot_settings, is_ci, scenario_colors, mode_from_fn
 
 cache_file = Path("particle_numbers_cache.pickle.xz")
@@ -36,20 +37,15 @@ for file in files:
         Ns, ts = cache[fn.name]
     else:
         try:
-            ed = ExtraData.load(fn)
-            sa = SimulationArchive(str(fn.with_suffix(".bin")))
+            orbits = load_orbit_table(fn)
         except:
             print("skipping")
             continue
-        ts = []
-        Ns = []
-        sim: Simulation
-        for sim in sa:
-            num_planetesimals = sum(ed.pd(p).type == "planetesimal" for p in sim.particles)
-            num_embryos = sum(ed.pd(p).type == "embryo" for p in sim.particles)
-            N = num_embryos + num_planetesimals
-            Ns.append(N)
-            ts.append(sim.t)
+        # number of embryos and planetesimals per snapshot
+        snapshots, first_rows = np.unique(orbits.snapshot, return_index=True)
+        is_counted = np.isin(orbits.type, [particle_type_codes["embryo"], particle_type_codes["planetesimal"]])
+        Ns = np.bincount(orbits.snapshot, weights=is_counted)[snapshots].astype(int).tolist()
+        ts = orbits.t[first_rows].tolist()
         cache[fn.name] = Ns, ts
     mode = mode_from_fn(fn)
     ax.step(ts, Ns, label=mode, where="post", color=scenario_colors[mode], linewidth=0.7,alpha=.5)
@@ -0,0 +1,12 @@
+"""
+fits the RBF interpolator for the current rsmc_dataset.jsonl and stores it in the cache
+so that simulations using the rbf massloss method don't need to do it on their first collision
+(run this after every change of the dataset)
+"""
+from sys import argv
+
+from massloss.rbf_massloss import load_artifact, dataset_file
+
+testrun = len(argv) > 1 and argv[1] == "test"
+artifact = load_artifact(dataset_file, testrun)
+print(f"{len(artifact.nodes)} nodes, dataset hash {artifact.dataset_hash}")
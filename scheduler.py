@@ -0,0 +1,392 @@
+"""
+runs all pending and unfinished simulations of a directory with a limited number of parallel processes
+
+A run is every <name>.yaml (as written by run_generator.py) that has not yet reached its tmax.
+Runs with the most remaining simulated time are started first, runs that crash are restarted
+from their last snapshot after an increasing delay and locks of processes that no longer exist are removed.
+The output of every run is appended to <name>.log.
+
+With --queue, several hosts that mount the same directory can each run a scheduler:
+a host claims a run by atomically creating <name>.lease (with host and PID, renewed by updating its mtime)
+while the simulation is running and stops the simulation if the lease was taken over by another host. Leases that were not renewed for --lease-timeout seconds
+(e.g. because the host crashed) are taken over by the next host.
+The clocks of the hosts need to be synchronized (e.g. by NTP) for this.
+--host can be used to start several workers with different names on one computer for testing.
+
+usage: python scheduler.py [directory] [--jobs N] [--max-attempts N] [--dry-run]
+       python scheduler.py [directory] --queue [--jobs N] [--host NAME] [--lease-timeout SECONDS]
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Dict, Set
+
+from extradata import ExtraData
+from utils import lock_owner, is_alive
+from water_sim import TMAX
+
+repo_dir = Path(__file__).resolve().parent
+poll_interval = 5  # seconds
+# delay before restarting a failed run: backoff_base * 2^(failures-1), but at most backoff_max
+backoff_base = 60  # seconds
+backoff_max = 3600  # seconds
+queue_poll_interval = 30  # seconds
+
+
+@dataclass
+class Run:
+    fn: Path
+    remaining: float  # simulated years until tmax
+    failures: int = 0
+    next_attempt: float = 0  # time.monotonic()
+    process: Optional[subprocess.Popen] = None
+
+    @property
+    def name(self) -> str:
+        return self.fn.name
+
+
+def remaining_time(fn: Path) -> float:
+    """
+    simulated years until the run is finished (0 if it is)
+    """
+    if not fn.with_suffix(".extra.json").exists():
+        return TMAX
+    meta = ExtraData.load_meta(fn)
+    if meta.current_time is None:
+        return meta.tmax
+    return max(meta.tmax - meta.current_time, 0)
+
+
+def check_lock(fn: Path, lease_holder: str = None) -> bool:
+    """
+    returns True if the run is locked by a running process and removes the lock if its process is gone
+
+    If this host holds the lease of the run, a lock of another host can't belong to a running process anymore.
+    """
+    lockfile = fn.with_suffix(".lock")
+    if not lockfile.exists():
+        return False
+    owner = lock_owner(fn)
+    if owner is None:
+        print(f"{fn.name}: lock without owner, remove {lockfile} if it is not running")
+        return True
+    host, pid = owner
+    if host != socket.gethostname():
+        if lease_holder is None:
+            return True  # can't check processes on other hosts
+        print(f"{fn.name}: removing lock of {host} whose lease expired")
+        lockfile.unlink()
+        return False
+    if is_alive(pid):
+        return True
+    print(f"{fn.name}: removing stale lock of PID {pid}")
+    lockfile.unlink()
+    return False
+
+
+def discover_runs(directory: Path) -> List[Run]:
+    runs = []
+    for parameter_file in sorted(directory.glob("*.yaml")):
+        fn = parameter_file.with_suffix("")
+        remaining = remaining_time(fn)
+        if remaining > 0:
+            runs.append(Run(fn, remaining))
+    # most remaining simulated time first
+    runs.sort(key=lambda run: run.remaining, reverse=True)
+    return runs
+
+
+def holder_file(fn: Path, host: str) -> Path:
+    return fn.with_suffix(f".lease.{host}.{os.getpid()}")
+
+
+def read_lease(fn: Path) -> Optional[Dict]:
+    """
+    host and PID of the holder of the lease and the time it was last renewed (its mtime)
+    """
+    try:
+        with fn.with_suffix(".lease").open() as f:
+            lease = json.load(f)
+            lease["heartbeat"] = os.fstat(f.fileno()).st_mtime
+            return lease
+    except FileNotFoundError:
+        return None
+
+
+def touch(file: Path) -> None:
+    # explicit times, so that all hosts compare times of their own clocks
+    now = time.time()
+    os.utime(file, (now, now))
+
+
+def claim_lease(fn: Path, host: str, lease_timeout: float) -> bool:
+    """
+    atomically creates the lease of a run (or takes over an expired one) and returns True if this host got it
+
+    <name>.lease is a hard link to the file of its holder, which is only created with link() and
+    therefore never overwritten. The holder renews it by updating the mtime of its own file.
+    """
+    lease_file = fn.with_suffix(".lease")
+    own_file = holder_file(fn, host)
+    with own_file.open("w") as f:
+        json.dump({"host": host, "pid": os.getpid()}, f)
+    try:
+        lease = read_lease(fn)
+        if lease is not None:
+            if time.time() - lease["heartbeat"] < lease_timeout:
+                return False
+            # move the expired lease away, only one host can succeed with this
+            expired_file = fn.with_suffix(f".lease.expired.{host}.{os.getpid()}")
+            try:
+                os.rename(lease_file, expired_file)
+            except FileNotFoundError:
+                return False
+            try:
+                moved_lease = json.loads(expired_file.read_text())
+                if time.time() - expired_file.stat().st_mtime < lease_timeout:
+                    # another host took over the lease in the meantime, give it back
+                    # (if yet another one already created a new lease, the renewal of that host notices it)
+                    try:
+                        os.link(expired_file, lease_file)
+                    except FileExistsError:
+                        pass
+                    return False
+            finally:
+                expired_file.unlink()
+        touch(own_file)
+        try:
+            # link() fails if the lease already exists (also on NFS, unlike O_EXCL on old versions)
+            os.link(own_file, lease_file)
+        except FileExistsError:
+            return False
+        if lease is not None:
+            print(f"{fn.name}: took over expired lease of {moved_lease['host']}")
+        return holds_lease(fn, host)
+    finally:
+        if not holds_lease(fn, host):
+            own_file.unlink()
+
+
+def holds_lease(fn: Path, host: str) -> bool:
+    try:
+        return os.path.samefile(fn.with_suffix(".lease"), holder_file(fn, host))
+    except FileNotFoundError:
+        return False
+
+
+def renew_lease(fn: Path, host: str) -> bool:
+    """
+    renews the lease of this host and returns False if it was lost to another host
+    """
+    own_file = holder_file(fn, host)
+    try:
+        touch(own_file)
+    except FileNotFoundError:
+        return False
+    # the lease could have been taken over just before the renewal
+    if holds_lease(fn, host):
+        return True
+    own_file.unlink()
+    return False
+
+
+def release_lease(fn: Path, host: str) -> None:
+    if holds_lease(fn, host):
+        fn.with_suffix(".lease").unlink()
+    holder_file(fn, host).unlink(missing_ok=True)
+
+
+def host_leases(directory: Path, host: str, lease_timeout: float) -> int:
+    """
+    number of valid leases of this host (of all workers running on it)
+    """
+    count = 0
+    for lease_file in directory.glob("*.lease"):
+        lease = read_lease(lease_file.with_suffix(""))
+        if lease and lease.get("host") == host and time.time() - lease["heartbeat"] < lease_timeout:
+            count += 1
+    return count
+
+
+def start(run: Run, extra_args: List[str]) -> None:
+    print(f"{run.name}: starting ({run.remaining:.0f} years left)")
+    with run.fn.with_suffix(".log").open("a") as log:
+        run.process = subprocess.Popen(
+            [sys.executable, "water_sim.py", str(run.fn.resolve())] + extra_args,
+            cwd=repo_dir, stdout=log, stderr=subprocess.STDOUT
+        )
+
+
+def finish(run: Run, max_attempts: int) -> bool:
+    """
+    handles a run whose process has exited and returns True if it should be started again
+    """
+    returncode = run.process.returncode
+    run.process = None
+    # a crashed water_sim.py doesn't remove its lock
+    check_lock(run.fn)
+    run.remaining = remaining_time(run.fn)
+    if returncode == 0 and run.remaining == 0:
+        print(f"{run.name}: finished")
+        return False
+    run.failures += 1
+    if run.failures >= max_attempts:
+        print(f"{run.name}: giving up after {run.failures} failed attempts (exit code {returncode})")
+        return False
+    delay = min(backoff_base * 2 ** (run.failures - 1), backoff_max)
+    print(f"{run.name}: exited with {returncode}, restarting from the last snapshot in {delay} s")
+    run.next_attempt = time.monotonic() + delay
+    return True
+
+
+def schedule(runs: List[Run], jobs: int, max_attempts: int, extra_args: List[str]) -> None:
+    waiting = list(runs)
+    running: List[Run] = []
+    while waiting or running:
+        for run in list(running):
+            if run.process.poll() is None:
+                continue
+            running.remove(run)
+            if finish(run, max_attempts):
+                waiting.append(run)
+        now = time.monotonic()
+        waiting.sort(key=lambda run: run.remaining, reverse=True)
+        for run in list(waiting):
+            if len(running) >= jobs:
+                break
+            if run.next_attempt > now:
+                continue
+            waiting.remove(run)
+            if check_lock(run.fn):
+                print(f"{run.name}: already running")
+                continue
+            start(run, extra_args)
+            running.append(run)
+        time.sleep(poll_interval)
+
+
+class WorkQueue:
+    """
+    runs unfinished runs of the directory that are not leased by another host until none are left
+    """
+
+    def __init__(self, directory: Path, host: str, jobs: int, max_attempts: int, lease_timeout: float,
+                 extra_args: List[str]):
+        self.directory = directory
+        self.host = host
+        self.jobs = jobs
+        self.max_attempts = max_attempts
+        self.lease_timeout = lease_timeout
+        self.extra_args = extra_args
+        self.running: List[Run] = []
+        self.given_up: Set[Path] = set()
+        self.backoff: Dict[Path, Run] = {}
+        # renew often enough that a short delay doesn't let the lease expire
+        self.poll_interval = min(queue_poll_interval, lease_timeout / 4)
+
+    def run(self) -> None:
+        try:
+            while self.step():
+                time.sleep(self.poll_interval)
+        finally:
+            # otherwise another host would start the same runs after the leases expired
+            for run in self.running:
+                self.stop(run)
+                release_lease(run.fn, self.host)
+
+    def stop(self, run: Run) -> None:
+        if run.process.poll() is not None:
+            return
+        run.process.send_signal(signal.SIGINT)
+        try:
+            # water_sim.py only handles the signal between savesteps or in a collision
+            run.process.wait(timeout=self.poll_interval)
+        except subprocess.TimeoutExpired:
+            print(f"{run.name}: killing the simulation as it didn't stop")
+            run.process.kill()
+            run.process.wait()
+
+    def step(self) -> bool:
+        """
+        renews the leases of the running simulations and starts new ones in free slots
+
+        returns False once there is nothing left to do
+        """
+        for run in list(self.running):
+            if run.process.poll() is None:
+                if renew_lease(run.fn, self.host):
+                    continue
+                # another host took over the run and will resume it, so this one must not write to its files
+                print(f"{run.name}: lost the lease, stopping the simulation")
+                self.running.remove(run)
+                self.stop(run)
+                continue
+            self.running.remove(run)
+            if finish(run, self.max_attempts):
+                self.backoff[run.fn] = run
+            elif run.remaining > 0:
+                self.given_up.add(run.fn)
+            release_lease(run.fn, self.host)
+        free_slots = self.jobs - host_leases(self.directory, self.host, self.lease_timeout)
+        if free_slots <= 0:
+            return True
+        now = time.monotonic()
+        candidates = [run for run in discover_runs(self.directory) if run.fn not in self.given_up]
+        if not candidates and not self.running:
+            print("no runs left")
+            return False
+        for candidate in candidates:
+            if free_slots <= 0:
+                break
+            run = self.backoff.get(candidate.fn, candidate)
+            if run.next_attempt > now or any(r.fn == run.fn for r in self.running):
+                continue
+            if not claim_lease(run.fn, self.host, self.lease_timeout):
+                continue
+            if check_lock(run.fn, lease_holder=self.host):
+                release_lease(run.fn, self.host)
+                continue
+            run.remaining = candidate.remaining
+            start(run, self.extra_args)
+            self.running.append(run)
+            free_slots -= 1
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run all unfinished simulations of a directory")
+    parser.add_argument("directory", nargs="?", default="data", type=Path)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of parallel simulations")
+    parser.add_argument("--max-attempts", type=int, default=5, help="give up on a run after this many failures")
+    parser.add_argument("--dry-run", action="store_true", help="only show the runs in the order they would start")
+    parser.add_argument("--test", action="store_true", help="start the runs as (short) test runs")
+    parser.add_argument("--queue", action="store_true", help="share the directory with schedulers on other hosts")
+    parser.add_argument("--host", default=socket.gethostname(), help="name of this host in the leases")
+    parser.add_argument("--lease-timeout", type=float, default=600,
+                        help="seconds after which the lease of a host that stopped renewing it is taken over")
+    args = parser.parse_args()
+    extra_args = ["test"] if args.test else []
+
+    if args.queue:
+        # also release the leases when being terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+        WorkQueue(args.directory, args.host, args.jobs, args.max_attempts, args.lease_timeout, extra_args).run()
+        return
+    runs = discover_runs(args.directory)
+    for run in runs:
+        print(f"{run.name}: {run.remaining:.0f} years left")
+    if args.dry_run:
+        return
+    schedule(runs, args.jobs, args.max_attempts, extra_args)
+
+
+if __name__ == '__main__':
+    main()
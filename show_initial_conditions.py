@@ -10,6 +10,7 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 from rebound import Simulation
 
 from extradata import ExtraData
+from utils import orbital_elements
 from water_sim import add_particles_from_conditions_file
 
 
@@ -27,17 +28,11 @@ orig_cmap: Colormap = matplotlib.cm.get_cmap('plasma_r')
 colors = orig_cmap(np.linspace(min_val, max_val, 20))
 # colors = ["black", "lightblue"]
 cmap: Colormap = LinearSegmentedColormap.from_list("mycmap", colors)
-a_list = []
-e_list = []
-m_list = []
-wf_list = []
-for p in sim.particles[3:]:
-    orbit = p.calculate_orbit(primary=sim.particles[0])
-    a_list.append(orbit.a)
-    e_list.append(orbit.e)
-    m_list.append(p.m)
-    wf_list.append(ed.pd(p).water_mass_fraction)
-m_list = np.asarray(m_list)
+orbits = orbital_elements(sim)[2:]  # without the gas giants
+a_list = orbits["a"]
+e_list = orbits["e"]
+m_list = orbits["m"]
+wf_list = [ed.pdata[hash].water_mass_fraction for hash in orbits["hash"].tolist()]
 with np.errstate(divide='ignore'):  # allow 0 water (becomes -inf)
     color_val = (np.log10(wf_list) + 5) / 5
 colors = cmap(color_val)
@@ -0,0 +1,114 @@
+"""
+time-indexed access to the snapshots of a run
+
+Opening a SimulationArchive reads through the whole .bin to find the snapshots.
+The times and file offsets it finds are cached in <run>.snapshots.npz (valid as long as size and mtime
+of the .bin don't change), so that a time window or every k-th snapshot can be selected
+by binary search and only the selected snapshots are ever deserialized.
+"""
+import os
+from ctypes import Structure, byref, c_char_p, c_int, c_double, c_uint32, POINTER
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+from rebound import SimulationArchive, Simulation, clibrebound
+
+# the header fields of struct reb_simulationarchive that are copied when reusing an index
+header_fields = ["version", "size_first", "size_snapshot", "auto_interval", "auto_walltime", "auto_step"]
+
+
+class _ArchiveIndex(Structure):
+    # same layout as SimulationArchive, but pointing to numpy arrays, so rebound must never free it
+    _fields_ = SimulationArchive._fields_
+
+
+class Snapshots:
+    def __init__(self, fn: Path):
+        self.fn = fn
+        self.binfile = fn.with_suffix(".bin")
+        self._archive: Optional[SimulationArchive] = None
+        stat = self.binfile.stat()
+        cache_file = fn.with_suffix(".snapshots.npz")
+        if cache_file.exists():
+            with np.load(cache_file) as cache:
+                if cache["bin_size"] == stat.st_size and cache["bin_mtime"] == stat.st_mtime_ns:
+                    self.times = cache["times"]
+                    self.offsets = cache["offsets"]
+                    self.header = {field: cache[field].item() for field in header_fields}
+                    return
+        self._archive = SimulationArchive(str(self.binfile), process_warnings=False)
+        num_snapshots = len(self._archive)
+        self.times = np.ctypeslib.as_array(self._archive.t, shape=(num_snapshots,)).copy()
+        self.offsets = np.ctypeslib.as_array(self._archive.offset, shape=(num_snapshots,)).copy()
+        self.header = {field: getattr(self._archive, field) for field in header_fields}
+        tmpfile = cache_file.with_suffix(".tmp.npz")
+        np.savez(tmpfile, times=self.times, offsets=self.offsets,
+                 bin_size=stat.st_size, bin_mtime=stat.st_mtime_ns, **self.header)
+        os.replace(tmpfile, cache_file)
+
+    @property
+    def archive(self) -> SimulationArchive:
+        """
+        the SimulationArchive opened with the cached index (without reading through the file)
+        """
+        if self._archive is None:
+            times = np.ascontiguousarray(self.times, dtype=np.float64)
+            offsets = np.ascontiguousarray(self.offsets, dtype=np.uint32)
+            index = _ArchiveIndex(
+                nblobs=len(times),
+                t=times.ctypes.data_as(POINTER(c_double)),
+                offset=offsets.ctypes.data_as(POINTER(c_uint32)),
+                **self.header
+            )
+            archive = SimulationArchive.__new__(SimulationArchive)
+            archive.setup = None
+            archive.setup_args = ()
+            archive.process_warnings = False
+            warnings = c_int(0)
+            # rebound copies the index, so the arrays only need to live during this call
+            clibrebound.reb_read_simulationarchive_with_messages(
+                byref(archive), c_char_p(str(self.binfile).encode()), byref(index), byref(warnings)
+            )
+            archive.tmin = times[0]
+            archive.tmax = times[-1]
+            self._archive = archive
+        return self._archive
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __getitem__(self, index: int) -> Simulation:
+        return self.archive[int(index)]
+
+    def index_at(self, t: float) -> int:
+        """
+        the last snapshot at or before t
+        """
+        return max(int(np.searchsorted(self.times, t, side="right")) - 1, 0)
+
+    def at(self, t: float) -> Simulation:
+        return self[self.index_at(t)]
+
+    def indices(self, tmin: float = None, tmax: float = None, step: int = 1) -> range:
+        """
+        every step-th snapshot with tmin <= t <= tmax
+        """
+        start = 0 if tmin is None else int(np.searchsorted(self.times, tmin, side="left"))
+        stop = len(self) if tmax is None else int(np.searchsorted(self.times, tmax, side="right"))
+        return range(start, stop, step)
+
+    def iterate(self, tmin: float = None, tmax: float = None, step: int = 1) -> Iterator[Simulation]:
+        """
+        lazily deserializes only the selected snapshots
+        """
+        for index in self.indices(tmin, tmax, step):
+            yield self[index]
+
+
+if __name__ == '__main__':
+    from utils import filename_from_argv
+
+    fn = filename_from_argv()
+    snapshots = Snapshots(fn)
+    print(f"{len(snapshots)} snapshots from t={snapshots.times[0]} to t={snapshots.times[-1]}")
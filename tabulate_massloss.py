@@ -0,0 +1,72 @@
+"""
+samples a deterministic mass loss estimator on a regular 4D grid over the clamped input range
+and saves it as a table for TabulatedMassloss (massloss method "tabulated")
+
+afterwards the maximum interpolation error of the table against the source estimator
+is measured at random points inside the grid
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from extradata import Meta
+from massloss import TabulatedMassloss
+from massloss.base_massloss import alpha_range, velocity_range, projectile_mass_range, gamma_range
+from merge import create_massloss_estimator
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("method", help="name of the massloss method to tabulate (e.g. rbf or simpleNN)")
+    parser.add_argument("-o", "--output", default="massloss_table.npz")
+    parser.add_argument("--alpha", default=25, type=int, help="grid points in alpha")
+    parser.add_argument("--velocity", default=33, type=int, help="grid points in v/v_esc")
+    parser.add_argument("--mass", default=33, type=int, help="grid points in log10(projectile mass)")
+    parser.add_argument("--gamma", default=19, type=int, help="grid points in gamma")
+    parser.add_argument("--test-points", default=10000, type=int,
+                        help="number of random points to check the interpolation error")
+    args = parser.parse_args()
+
+    estimator = create_massloss_estimator(Meta(massloss_method=args.method))
+    if not estimator.deterministic:
+        raise ValueError(f"{estimator.name} is not deterministic and can't be tabulated")
+
+    ranges = [alpha_range, velocity_range, np.log10(projectile_mass_range), gamma_range]
+    sizes = [args.alpha, args.velocity, args.mass, args.gamma]
+    if min(sizes) < 2:
+        raise ValueError("every axis needs at least two grid points")
+    axes = [np.linspace(low, high, num) for (low, high), num in zip(ranges, sizes)]
+    grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 4)
+    grid[:, 2] = 10 ** grid[:, 2]
+
+    print(f"evaluating {args.method} at {len(grid)} grid points")
+    start = time.perf_counter()
+    table = estimator.estimate_batch(grid).reshape(*sizes, 3)
+    print(f"took {time.perf_counter() - start:.1f} s")
+
+    output = Path(args.output)
+    with output.open("wb") as f:
+        np.savez(
+            f,
+            source=np.array(estimator.name),
+            start=np.array([axis[0] for axis in axes]),
+            step=np.array([axis[1] - axis[0] for axis in axes]),
+            table=table.astype(np.float32),
+        )
+    print(f"saved {output} ({output.stat().st_size / 1e6:.1f} MB)")
+
+    tabulated = TabulatedMassloss(output)
+    rng = np.random.default_rng(1)
+    test_input = np.column_stack([rng.uniform(low, high, args.test_points) for low, high in ranges])
+    test_input[:, 2] = 10 ** test_input[:, 2]
+    error = np.abs(tabulated.estimate_batch(test_input) - estimator.estimate_batch(test_input))
+    print("mean interpolation error (water, mantle, core):", error.mean(axis=0))
+    print("max interpolation error (water, mantle, core):", error.max(axis=0))
+    worst = np.unravel_index(np.argmax(error), error.shape)[0]
+    print("worst input (alpha, velocity, projectile_mass, gamma):", test_input[worst])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,53 @@
-from merge import interpolate
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from extradata import ExtraData, Journal, ParticleData, CollisionMeta
+
+
+class FakeHash:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeParticle:
+    def __init__(self, hash):
+        self.hash = FakeHash(hash)
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+def crash(*args, **kwargs):
+    raise SimulatedCrash()
+
+
+def state(ed: ExtraData) -> str:
+    return json.dumps([ed.meta.save(), {k: v.save() for k, v in ed.pdata.items()}, ed.tree.save()])
+
+
+def simulate_step(ed: ExtraData, step: int) -> None:
+    # a collision of two bodies into a new one (with a new hash) and an escape
+    ed.meta.current_time = step
+    ed.meta.hash_counter += 1
+    new = 10 + step
+    ed.pdata[new] = ParticleData(water_mass_fraction=0.2, core_mass_fraction=0.3, type="embryo", total_mass=2.)
+    ed.tree.add(FakeParticle(step), FakeParticle(step + 1), FakeParticle(new), CollisionMeta(time=step))
+    ed.pdata[step].escaped = float(step)
+
+
+def start_run(fn: Path) -> ExtraData:
+    ed = ExtraData()
+    for h in range(1, 8):
+        ed.pdata[h] = ParticleData(water_mass_fraction=0.1, core_mass_fraction=0.3, type="embryo", total_mass=1.)
+    ed.save_incremental(fn)
+    return ed
+
+
+def test_interpolate():
+    from merge import interpolate
 
-if __name__ == '__main__':
     assert (
             interpolate(8.483327468402893, 1.0986714742080539, 6.62638e+23, 0.9134265730409874)
             ==
@@ -12,3 +59,83 @@ if __name__ == '__main__':
             ==
             (0.5355362926702285, 0.7751899699855702)
     )
+
+
+def test_journal_truncated():
+    # truncating the journal at any byte must give the state of the last complete save
+    with TemporaryDirectory() as tmpdir:
+        fn = Path(tmpdir) / "journaltest"
+        ed = start_run(fn)
+        states = [(0, state(ed))]
+        for step in range(1, 4):
+            simulate_step(ed, step)
+            ed.save_incremental(fn)
+            states.append((ed.journal.filename.stat().st_size, state(ed)))
+        journal_file = fn.with_suffix(".extra.journal")
+        full_journal = journal_file.read_bytes()
+        assert state(ExtraData.load(fn)) == states[-1][1]
+        for size in range(len(full_journal) + 1):
+            journal_file.write_bytes(full_journal[:size])
+            expected = [s for committed_size, s in states if committed_size <= size][-1]
+            loaded = ExtraData.load(fn)
+            assert state(loaded) == expected, size
+            assert ExtraData.load_meta(fn) == loaded.meta, size
+            # continuing after a crash must not keep the broken record
+            loaded.meta.current_time = 100
+            loaded.save_incremental(fn)
+            assert state(ExtraData.load(fn)) == state(loaded), size
+
+
+def check_crash_during_compaction(crashing_method) -> None:
+    """
+    a crash in this part of ExtraData.save must load as the state that was being saved
+    and continuing from there must work like without the crash
+    """
+    with TemporaryDirectory() as tmpdir:
+        fn = Path(tmpdir) / "journaltest"
+        ed = start_run(fn)
+        for step in range(1, 3):
+            simulate_step(ed, step)
+            ed.save_incremental(fn)
+        simulate_step(ed, 3)
+        owner, name = crashing_method
+        original = getattr(owner, name)
+        setattr(owner, name, crash)
+        try:
+            ed.save(fn)
+            raise AssertionError("the save didn't crash")
+        except SimulatedCrash:
+            pass
+        finally:
+            setattr(owner, name, original)
+
+        loaded = ExtraData.load(fn)
+        assert state(loaded) == state(ed)
+        assert loaded.meta.hash_counter == ed.meta.hash_counter
+        assert ExtraData.load_meta(fn) == ed.meta
+
+        for step in range(4, 6):
+            simulate_step(ed, step)
+            simulate_step(loaded, step)
+            loaded.save_incremental(fn)
+        assert state(ExtraData.load(fn)) == state(ed)
+        loaded.save(fn)
+        assert state(ExtraData.load(fn)) == state(ed)
+
+
+def test_crash_before_journal_clear():
+    # the .extra.json is already replaced, but the journal of the previous generation is still there
+    check_crash_during_compaction((Journal, "clear"))
+
+
+def test_crash_before_extra_file():
+    # the .pdata.npy is already written, but the .extra.json is still the old one
+    check_crash_during_compaction((ExtraData, "write_extra_file"))
+
+
+if __name__ == '__main__':
+    test_journal_truncated()
+    test_crash_before_journal_clear()
+    test_crash_before_extra_file()
+    print("journal ok")
+    test_interpolate()
@@ -1,6 +1,6 @@
 import argparse
 from collections import namedtuple
-from math import log10, degrees
+from math import log10
 
 import matplotlib
 import matplotlib.animation as animation
@@ -10,11 +10,11 @@ from matplotlib.cm import ScalarMappable
 from matplotlib.collections import PathCollection
 from matplotlib.colors import Normalize, Colormap
 from matplotlib.text import Text
-from rebound import SimulationArchive, Particle
 from scipy.constants import mega
 
-from extradata import ExtraData, ParticleData
-from utils import filename_from_argv
+from extradata import ExtraData
+from snapshots import Snapshots
+from utils import filename_from_argv, orbital_elements
 
 output_plots = False
 if output_plots:
@@ -39,7 +39,8 @@ cmap: Colormap = matplotlib.cm.get_cmap('Blues')
 mean_mass = None
 
 
-def update_plot(num: int, args: MyProgramArgs, sa: SimulationArchive, ed: ExtraData, dots: PathCollection, title: Text):
+def update_plot(num: int, args: MyProgramArgs, snapshots: Snapshots, ed: ExtraData, dots: PathCollection,
+                title: Text):
     global mean_mass
     total_frames = args.fps * args.duration
     if args.log_time:
@@ -50,7 +51,7 @@ def update_plot(num: int, args: MyProgramArgs, sa: SimulationArchive, ed: ExtraD
         print(num / total_frames)
         time = num * timestep
     print(f"{num / total_frames:.2f}, {time:.0f}")
-    sim = sa.getSimulation(t=time)
+    sim = snapshots.at(time)
     if time < 1e3:
         timestr = f"{time:.0f}"
     elif time < 1e6:
@@ -59,25 +60,20 @@ def update_plot(num: int, args: MyProgramArgs, sa: SimulationArchive, ed: ExtraD
         timestr = f"{time / 1e6:.2f}M"
     title.set_text(f"({len(sim.particles)}) {timestr} Years")
 
-    p: Particle
-
-    water_fractions = []
-    for p in sim.particles[1:]:
-        pd: ParticleData = ed.pd(p)
-        wf = pd.water_mass_fraction
-        water_fractions.append(wf)
+    orbits = orbital_elements(sim, jacobi=True)
+    water_fractions = [ed.pdata[hash].water_mass_fraction for hash in orbits["hash"].tolist()]
     # a, e, i, M, M_rat = data[line]
     # title.set_text(f"({len(a)}) {ages[line]:.2f}K Years")
-    a = [p.a for p in sim.particles[1:]]
-    m = np.array([p.m for p in sim.particles[1:]])
+    a = orbits["a"]
+    m = orbits["m"].copy()
     m[:2] /= 1e2
 
     if args.y_axis == "e":
-        bla = np.array([a, [p.e for p in sim.particles[1:]]])
+        bla = np.array([a, orbits["e"]])
     elif args.y_axis == "i":
-        bla = np.array([a, [degrees(p.inc) for p in sim.particles[1:]]])
+        bla = np.array([a, np.degrees(orbits["inc"])])
     elif args.y_axis == "Omega":
-        bla = np.array([a, [degrees(p.Omega) for p in sim.particles[1:]]])
+        bla = np.array([a, np.degrees(orbits["Omega"])])
     else:
         raise ValueError("invalid y-axis")
     dots.set_offsets(bla.T)
@@ -104,7 +100,7 @@ def main(args: MyProgramArgs):
     l: PathCollection = plt.scatter([1], [1])
 
     fn = filename_from_argv()
-    sa = SimulationArchive(str(fn.with_suffix(".bin")))
+    snapshots = Snapshots(fn)
     ed = ExtraData.load(fn)
 
     plt.xlim(0, 10)
@@ -130,7 +126,7 @@ def main(args: MyProgramArgs):
     fig1.colorbar(ScalarMappable(norm=Normalize(vmin=-5, vmax=0), cmap=cmap), label="log(water fraction)")
 
     plt.tight_layout()
-    line_ani = animation.FuncAnimation(fig1, update_plot, total_frames, fargs=(args, sa, ed, l, title),
+    line_ani = animation.FuncAnimation(fig1, update_plot, total_frames, fargs=(args, snapshots, ed, l, title),
                                        interval=1000 / args.fps, repeat=False)
     if args.save_video:
         name = f"{args.y_axis}_{args.log_time}"
@@ -6,11 +6,11 @@ from matplotlib.axes import Axes
 from matplotlib.cm import ScalarMappable
 from matplotlib.colors import Normalize
 from matplotlib.figure import Figure
-from rebound import SimulationArchive
 from scipy.constants import mega
 
 from extradata import ExtraData
-from utils import filename_from_argv, get_water_cmap
+from snapshots import Snapshots
+from utils import filename_from_argv, get_water_cmap, orbital_elements
 
 mean_mass = 5.208403167890638e+24  # constant between plots
 size_mult = 100
@@ -18,14 +18,14 @@ size_mult = 100
 
 def plot_file(file, time, ax: Axes, mode):
     fn = filename_from_argv(file)
-    sa = SimulationArchive(str(fn.with_suffix(".bin")))
     ed = ExtraData.load(fn)
-    sim = sa.getSimulation(t=time)
+    sim = Snapshots(fn).at(time)
 
-    water_fractions = [ed.pd(p).water_mass_fraction for p in sim.particles[1:]]
-    a = [p.a for p in sim.particles[1:]]
-    e = [p.e for p in sim.particles[1:]]
-    m = np.array([p.m for p in sim.particles[1:]])
+    orbits = orbital_elements(sim, jacobi=True)
+    water_fractions = [ed.pdata[hash].water_mass_fraction for hash in orbits["hash"].tolist()]
+    a = orbits["a"]
+    e = orbits["e"]
+    m = orbits["m"]
     # m[:2] /= 1e2 # reduce size of gas giants
     sizes = (np.array(m) / mean_mass) ** (2 / 3) * size_mult
     with np.errstate(divide='ignore'):  # allow 0 water (becomes -inf)
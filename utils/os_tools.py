@@ -3,6 +3,7 @@ import socket
 import subprocess
 from pathlib import Path
 from sys import argv
+from typing import Optional, Tuple
 
 from setproctitle import setproctitle
 
@@ -40,6 +41,33 @@ def process_friendlyness(fn: Path) -> None:
     os.nice(5)
 
 
+def write_lock(fn: Path) -> None:
+    """
+    the .lock of a running simulation records host and PID so that stale locks can be detected
+    """
+    fn.with_suffix(".lock").write_text(f"{socket.gethostname()} {os.getpid()}\n")
+
+
+def lock_owner(fn: Path) -> Optional[Tuple[str, int]]:
+    """
+    host and PID of the process holding the lock (None for locks of older versions without them)
+    """
+    content = fn.with_suffix(".lock").read_text().split()
+    if len(content) != 2:
+        return None
+    return content[0], int(content[1])
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # exists, but belongs to another user
+        return True
+    return True
+
+
 def set_process_title(fn: Path, progress: float, bodies: int) -> None:
     setproctitle(f"watersim [{fn.stem}] {progress * 100:.2f}% finished, {bodies} bodies")
 
@@ -1,9 +1,9 @@
 from ctypes import c_uint32
 from random import randint
-from typing import Dict
+from typing import Dict, Tuple
 
-from numpy import linalg
-from rebound import Simulation, Orbit, OrbitPlot, Particle
+import numpy as np
+from rebound import Simulation, OrbitPlot, Particle
 from scipy.constants import pi, gravitational_constant
 
 from extradata import ExtraData
@@ -24,19 +24,186 @@ def unique_hash(ed: ExtraData) -> c_uint32:
     return c_uint32(ed.meta.hash_counter)
 
 
-def innermost_period(sim: Simulation) -> float:
+class ParticleArrays:
+    """
+    hashes, masses, radii, positions and velocities of all particles
+
+    They are copied with one call to sim.serialize_particle_data into buffers
+    that are reused as long as the number of particles doesn't grow.
+    """
+
+    def __init__(self):
+        self._hash = np.empty(0, dtype=np.uint32)
+        self._m = np.empty(0)
+        self._r = np.empty(0)
+        self._xyz = np.empty((0, 3))
+        self._vxvyvz = np.empty((0, 3))
+        self.N = 0
+
+    def update(self, sim: Simulation) -> "ParticleArrays":
+        if sim.N > len(self._m):
+            self._hash = np.empty(sim.N, dtype=np.uint32)
+            self._m = np.empty(sim.N)
+            self._r = np.empty(sim.N)
+            self._xyz = np.empty((sim.N, 3))
+            self._vxvyvz = np.empty((sim.N, 3))
+        sim.serialize_particle_data(hash=self._hash, m=self._m, r=self._r, xyz=self._xyz, vxvyvz=self._vxvyvz)
+        self.N = sim.N
+        return self
+
+    @property
+    def hash(self) -> np.ndarray:
+        return self._hash[:self.N]
+
+    @property
+    def m(self) -> np.ndarray:
+        return self._m[:self.N]
+
+    @property
+    def r(self) -> np.ndarray:
+        return self._r[:self.N]
+
+    @property
+    def xyz(self) -> np.ndarray:
+        return self._xyz[:self.N]
+
+    @property
+    def vxvyvz(self) -> np.ndarray:
+        return self._vxvyvz[:self.N]
+
+
+def particle_arrays(sim: Simulation, arrays: ParticleArrays = None) -> ParticleArrays:
+    """
+    arrays that were passed explicitly are expected to be up to date,
+    otherwise the current particles are copied into new ones
+    (not into shared buffers, as several simulations can run on different threads)
+    """
+    if arrays is not None:
+        return arrays
+    return ParticleArrays().update(sim)
+
+
+def relative_to_primaries(sim: Simulation, arrays: ParticleArrays,
+                          jacobi: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    positions, velocities and mu of every particle except the first one relative to its primary:
+    the first particle or (with jacobi=True, like Particle.orbit) the center of mass of all previous particles
+    """
+    m = arrays.m
+    if jacobi:
+        primary_m = np.cumsum(m)[:-1]
+        primary_xyz = np.cumsum(m[:, None] * arrays.xyz, axis=0)[:-1] / primary_m[:, None]
+        primary_vxvyvz = np.cumsum(m[:, None] * arrays.vxvyvz, axis=0)[:-1] / primary_m[:, None]
+    else:
+        primary_m = m[0]
+        primary_xyz = arrays.xyz[0]
+        primary_vxvyvz = arrays.vxvyvz[0]
+    return arrays.xyz[1:] - primary_xyz, arrays.vxvyvz[1:] - primary_vxvyvz, sim.G * (primary_m + m[1:])
+
+
+def jacobi_orbits(sim: Simulation, arrays: ParticleArrays = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    returns semi-major axis and orbital period of every particle except the first one
+    in Jacobi coordinates (the same as Particle.a and Particle.P)
+    """
+    arrays = particle_arrays(sim, arrays)
+    dxyz, dvxvyvz, mu = relative_to_primaries(sim, arrays, jacobi=True)
+    distance = np.linalg.norm(dxyz, axis=1)
+    v_squared = np.sum(dvxvyvz ** 2, axis=1)
+    a = 1 / (2 / distance - v_squared / mu)
+    period = 2 * pi * np.sqrt(np.abs(a) ** 3 / mu)
+    return a, period
+
+
+orbit_dtype = np.dtype([
+    ("hash", np.uint32),
+    ("m", np.float64),
+    ("r", np.float64),
+    ("a", np.float64),
+    ("e", np.float64),
+    ("inc", np.float64),
+    ("Omega", np.float64),
+    ("omega", np.float64),
+    ("M", np.float64),
+])
+
+
+def _acos2(num: np.ndarray, denom: np.ndarray, disambiguator: np.ndarray) -> np.ndarray:
+    # the same as acos2 in rebound's tools.c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosine = num / denom
+    val = np.where(cosine <= -1., pi, 0.)
+    inside = (cosine > -1.) & (cosine < 1.)
+    val[inside] = np.arccos(cosine[inside])
+    return np.where(inside & (disambiguator < 0), -val, val)
+
+
+def orbital_elements(sim: Simulation, arrays: ParticleArrays = None, jacobi: bool = False) -> np.ndarray:
+    """
+    returns the orbits of all particles except the first one in one vectorized pass
+    (relative to the first particle or in Jacobi coordinates like Particle.orbit)
+    instead of creating an Orbit object through ctypes for every particle and property
+
+    all angles are in [0, 2pi) except the mean anomaly of unbound orbits
+    """
+    arrays = particle_arrays(sim, arrays)
+    dxyz, dvxvyvz, mu = relative_to_primaries(sim, arrays, jacobi)
+    dx, dy, dz = dxyz.T
+    dvx, dvy, dvz = dvxvyvz.T
+    d = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+    v_squared = dvx ** 2 + dvy ** 2 + dvz ** 2
+    v_circ_squared = mu / d
+    a = -mu / (v_squared - 2 * v_circ_squared)
+    hx = dy * dvz - dz * dvy
+    hy = dz * dvx - dx * dvz
+    hz = dx * dvy - dy * dvx
+    h = np.sqrt(hx ** 2 + hy ** 2 + hz ** 2)
+    v_diff_squared = v_squared - v_circ_squared
+    vr = (dx * dvx + dy * dvy + dz * dvz) / d
+    rvr = d * vr
+    ex = (v_diff_squared * dx - rvr * dvx) / mu
+    ey = (v_diff_squared * dy - rvr * dvy) / mu
+    ez = (v_diff_squared * dz - rvr * dvz) / mu
+    e = np.sqrt(ex ** 2 + ey ** 2 + ez ** 2)
+    inc = _acos2(hz, h, np.ones_like(h))
+    nx = -hy
+    ny = hx
+    n = np.sqrt(nx ** 2 + ny ** 2)
+    Omega = _acos2(nx, n, ny)
+    omega = _acos2(nx * ex + ny * ey, n * e, ez)
+    # like rebound, omega of (nearly) planar orbits is derived from the longitude of pericenter,
+    # while Omega is kept as whatever the tiny components of the node vector give
+    planar = (inc < 1e-8) | (inc > pi - 1e-8)
+    pomega = _acos2(ex, e, ey)
+    omega[planar] = np.where(inc[planar] < pi / 2, pomega[planar] - Omega[planar], Omega[planar] - pomega[planar])
+    # mean anomaly from the eccentric (or hyperbolic) anomaly
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bound = e < 1
+        ea = _acos2(1 - d / a, e, vr)
+        cosh_f = (1 - d / a) / e
+        hyperbolic_anomaly = np.sign(vr) * np.arccosh(np.maximum(cosh_f, 1.))
+        M = np.where(bound, ea - e * np.sin(ea), e * np.sinh(hyperbolic_anomaly) - hyperbolic_anomaly)
+
+    orbits = np.empty(arrays.N - 1, dtype=orbit_dtype)
+    orbits["hash"] = arrays.hash[1:]
+    orbits["m"] = arrays.m[1:]
+    orbits["r"] = arrays.r[1:]
+    orbits["a"] = a
+    orbits["e"] = e
+    orbits["inc"] = inc
+    orbits["Omega"] = np.mod(Omega, 2 * pi)
+    orbits["omega"] = np.mod(omega, 2 * pi)
+    orbits["M"] = np.where(bound, np.mod(M, 2 * pi), M)
+    return orbits
+
+
+def innermost_period(sim: Simulation, arrays: ParticleArrays = None) -> float:
     """
     returns the orbital period in years of the innerpost object
     for comparison with symplectic time step
     """
-    minp = None
-    mina = float("inf")
-    for p in sim.particles[1:]:
-        if abs(p.a) < mina:
-            mina = abs(p.a)
-            minp = p
-    orb: Orbit = minp.orbit
-    return abs(orb.P)
+    a, period = jacobi_orbits(sim, arrays)
+    return period[np.argmin(np.abs(a))]
 
 
 def third_kepler_law(orbital_period: float):
@@ -46,18 +213,14 @@ def third_kepler_law(orbital_period: float):
            ) ** (1 / 3)
 
 
-def total_momentum(sim: Simulation) -> float:
-    total = 0
-    for p in sim.particles:
-        total += linalg.norm(p.vxyz) * p.m
-    return total
+def total_momentum(sim: Simulation, arrays: ParticleArrays = None) -> float:
+    arrays = particle_arrays(sim, arrays)
+    return float(np.dot(np.linalg.norm(arrays.vxvyvz, axis=1), arrays.m))
 
 
-def total_mass(sim: Simulation) -> float:
-    total = 0
-    for p in sim.particles:
-        total += p.m
-    return total
+def total_mass(sim: Simulation, arrays: ParticleArrays = None) -> float:
+    arrays = particle_arrays(sim, arrays)
+    return float(arrays.m.sum())
 
 
 def show_orbits(sim: Simulation):
@@ -1,11 +1,15 @@
+import os
 import re
+import socket
+import sqlite3
 import time
-from ctypes import Structure, c_uint32, c_double, c_uint, cdll, c_int, create_string_buffer, c_char_p
+import traceback
 from dataclasses import dataclass
 from pathlib import Path
 from shutil import copy
 from sys import argv
-from typing import Tuple
+from threading import Thread
+from typing import Tuple, List
 
 import rebound
 import yaml
@@ -13,26 +17,26 @@ from rebound import Simulation, Particle, NoParticles, SimulationArchive
 from rebound.simulation import POINTER_REB_SIM, reb_collision
 from scipy.constants import astronomical_unit, mega, year
 
+import catalog
 from extradata import ExtraData, ParticleData
-from merge import merge_particles
+from heartbeat_context import Heartbeat, HB_ESCAPE, HB_SUN_COLLISION, HB_WIDE_ORBIT
+from massloss import Massloss
+from merge import merge_particles, create_massloss_estimator
 from utils import unique_hash, filename_from_argv, innermost_period, total_momentum, process_friendlyness, total_mass, \
-    third_kepler_law, solar_radius, git_hash, check_heartbeat_needs_recompile, PlanetaryRadius, set_process_title
+    third_kepler_law, solar_radius, git_hash, PlanetaryRadius, set_process_title, ParticleArrays, write_lock, \
+    lock_owner
 
 MIN_TIMESTEP_PER_ORBIT = 20
+TMAX = 200 * mega  # years
 
-abort = False
+# boundaries and how often (in steps) the heartbeat checks them
+HEARTBEAT_CHECK_INTERVAL = 100
+MAX_DISTANCE_FROM_SUN = 150  # AU
+MAX_PERIHELION_DISTANCE = 11  # AU
+# relative margin around the boundaries in which the heartbeat calculates the full orbit of a body
+HEARTBEAT_SCREENING_MARGIN = 0.05
 
-
-class hb_event(Structure):
-    _fields_ = [("hash", c_uint32),
-                ("time", c_double),
-                ("new", c_uint)]
-    hash: int
-    time: float
-    new: int
-
-
-hb_event_list = hb_event * 500
+HEARTBEAT_EVENT_CAPACITY = 1024
 
 
 @dataclass
@@ -40,6 +44,11 @@ class Parameters:
     initcon_file: str
     massloss_method: str
     no_merging: bool = False
+    massloss_cache_tolerance: float = None
+    massloss_cache_size: int = 10000
+    massloss_table: str = None
+    energy_interval: int = 10000  # steps between energy log entries
+    energy_active_only_above: int = None  # ignore the potential between test particles above this number of particles
 
 
 def add_particles_from_conditions_file(sim: Simulation, ed: ExtraData,
@@ -102,8 +111,75 @@ def add_particles_from_conditions_file(sim: Simulation, ed: ExtraData,
     return num_planetesimals, num_embryos
 
 
-def main(fn: Path, testrun=False):
-    global abort
+@dataclass
+class RunState:
+    """
+    everything that belongs to one simulation, so that several of them can run in the same process
+    """
+    fn: Path
+    extradata: ExtraData
+    heartbeat: Heartbeat = None
+    abort: bool = False
+    num_collisions: int = 0  # since the last savestep
+    estimator: Massloss = None
+    estimator_loader: Thread = None
+    estimator_error: BaseException = None
+
+    def preload_estimator(self) -> None:
+        """
+        creates the mass loss estimator in the background while the simulation is set up and integrated,
+        so that the first collision doesn't have to wait for it
+        """
+
+        def load() -> None:
+            try:
+                self.estimator = create_massloss_estimator(self.extradata.meta, shared=True)
+            except BaseException as exception:
+                print("loading the mass loss estimator failed:", exception)
+                self.estimator_error = exception
+
+        self.estimator_loader = Thread(target=load, name=f"{self.fn.name} estimator", daemon=True)
+        self.estimator_loader.start()
+
+    def massloss_estimator(self) -> Massloss:
+        if self.estimator_loader is not None:
+            if self.estimator_loader.is_alive():
+                print("waiting for the mass loss estimator")
+                start = time.perf_counter()
+                self.estimator_loader.join()
+                print(f"waited {time.perf_counter() - start:.1f} s")
+            self.estimator_loader = None
+            if self.estimator_error is not None:
+                raise self.estimator_error
+        if self.estimator is None:
+            self.estimator = create_massloss_estimator(self.extradata.meta, shared=True)
+        return self.estimator
+
+    def collision_resolve_handler(self, sim_p: POINTER_REB_SIM, collision: reb_collision) -> int:
+        self.num_collisions += 1
+        try:
+            return merge_particles(sim_p, collision, ed=self.extradata, estimator=self.massloss_estimator())
+        except BaseException as exception:
+            print("exception during collision_resolve")
+            print(exception)
+            # needed as exceptions don't halt integration
+            self.abort = True
+            sim_p.contents._status = 1
+            raise exception
+
+
+def update_catalog(fn: Path, ed: ExtraData, snapshot_count: int) -> None:
+    try:
+        catalog.update_run(fn, ed, snapshot_count)
+    except sqlite3.Error as e:
+        # the catalog can always be rebuilt, so this should never stop a simulation
+        print("could not update run catalog:", e)
+
+
+def main(fn: Path, testrun=False) -> bool:
+    """
+    runs (or continues) the simulation and returns False if it had to be aborted
+    """
     start = time.perf_counter()
 
     if not fn.with_suffix(".bin").exists():
@@ -126,7 +202,7 @@ def main(fn: Path, testrun=False):
             sim.collision = "direct"
         sim.ri_mercurius.hillfac = 3.
         sim.testparticle_type = 1
-        tmax = 200 * mega
+        tmax = TMAX
         num_savesteps = 20000
         if testrun:
             tmax /= 200000
@@ -140,8 +216,16 @@ def main(fn: Path, testrun=False):
         extradata.meta.git_hash = git_hash()
         extradata.meta.rebound_hash = rebound.__githash__
         extradata.meta.massloss_method = parameters.massloss_method
+        extradata.meta.massloss_cache_tolerance = parameters.massloss_cache_tolerance
+        extradata.meta.massloss_cache_size = parameters.massloss_cache_size
+        extradata.meta.massloss_table = parameters.massloss_table
         extradata.meta.initcon_file = parameters.initcon_file
         extradata.meta.no_merging = parameters.no_merging
+        extradata.meta.energy_interval = parameters.energy_interval
+        extradata.meta.energy_active_only_above = parameters.energy_active_only_above
+        state = RunState(fn, extradata)
+        if not parameters.no_merging:
+            state.preload_estimator()
 
         num_planetesimals, num_embryos = \
             add_particles_from_conditions_file(sim, extradata, parameters.initcon_file, testrun)
@@ -150,26 +234,27 @@ def main(fn: Path, testrun=False):
         extradata.meta.initial_N = sim.N
         extradata.meta.initial_N_planetesimal = num_planetesimals
         extradata.meta.initial_N_embryo = num_embryos
-        extradata.history.append(
-            energy=sim.calculate_energy(),
-            momentum=total_momentum(sim),
-            total_mass=total_mass(sim),
-            time=sim.t,
-            N=sim.N,
-            N_active=sim.N_active
-        )
         cputimeoffset = walltimeoffset = 0
         t = 0
+        snapshot_count = 0
     else:
         if fn.with_suffix(".lock").exists():
             raise FileExistsError("Lock file found, is the simulation currently running?")
         copy(fn.with_suffix(".bin"), fn.with_suffix(".bak.bin"))
         copy(fn.with_suffix(".extra.json"), fn.with_suffix(".extra.bak.json"))
+        if fn.with_suffix(".pdata.npy").exists():
+            copy(fn.with_suffix(".pdata.npy"), fn.with_suffix(".pdata.bak.npy"))
+        if fn.with_suffix(".extra.journal").exists():
+            copy(fn.with_suffix(".extra.journal"), fn.with_suffix(".extra.bak.journal"))
         sa = SimulationArchive(str(fn.with_suffix(".bin")))
         extradata = ExtraData.load(fn)
+        state = RunState(fn, extradata)
+        if not extradata.meta.no_merging:
+            state.preload_estimator()
         tmax = extradata.meta.tmax
         per_savestep = extradata.meta.per_savestep
         sim = sa[-1]
+        snapshot_count = len(sa)
         t = round(sim.t + per_savestep)
         print(f"continuing from {t}")
         sim.move_to_com()
@@ -184,39 +269,45 @@ def main(fn: Path, testrun=False):
         cputimeoffset = extradata.meta.cputime
         walltimeoffset = extradata.meta.walltime
 
-    check_heartbeat_needs_recompile()
-    clibheartbeat = cdll.LoadLibrary("heartbeat/heartbeat.so")
-    clibheartbeat.init_logfile.argtypes = [c_char_p]
-    logfile = create_string_buffer(128)
-    logfile.value = str(fn.with_suffix(".energylog.csv")).encode()
-    clibheartbeat.init_logfile(logfile)
-    sim.heartbeat = clibheartbeat.heartbeat
+    heartbeat = Heartbeat(HEARTBEAT_EVENT_CAPACITY, logfile=fn.with_suffix(".energylog.bin"))
+    heartbeat.attach(sim)
+    state.heartbeat = heartbeat
     innermost_semimajor_axis = third_kepler_law(
         orbital_period=sim.dt * year * MIN_TIMESTEP_PER_ORBIT
     ) / astronomical_unit * 1.1
     print(f"innermost semimajor axis is {innermost_semimajor_axis}")
 
-    c_double.in_dll(clibheartbeat, "min_distance_from_sun_squared").value = innermost_semimajor_axis ** 2
-    c_double.in_dll(clibheartbeat, "max_distance_from_sun_squared").value = 150 ** 2
-
-    assert sim.dt < innermost_period(sim) / MIN_TIMESTEP_PER_ORBIT
+    context = heartbeat.context
+    context.min_distance_from_sun_squared = innermost_semimajor_axis ** 2
+    context.max_distance_from_sun_squared = MAX_DISTANCE_FROM_SUN ** 2
+    context.max_perihelion_distance = MAX_PERIHELION_DISTANCE
+    context.screening_margin = HEARTBEAT_SCREENING_MARGIN
+    context.check_interval = HEARTBEAT_CHECK_INTERVAL
+    if extradata.meta.energy_interval is not None:
+        context.energy_interval = extradata.meta.energy_interval
+    context.energy_active_only_above = extradata.meta.energy_active_only_above or 0
+
+    # copied once per savestep for all diagnostics
+    arrays = ParticleArrays().update(sim)
+
+    if snapshot_count == 0:
+        # calculated in the same way as all later energies
+        extradata.history.append(
+            energy=heartbeat.track_energy(),
+            momentum=total_momentum(sim, arrays),
+            total_mass=total_mass(sim, arrays),
+            time=sim.t,
+            N=sim.N,
+            N_active=sim.N_active
+        )
 
-    def collision_resolve_handler(sim_p: POINTER_REB_SIM, collision: reb_collision) -> int:
-        global abort  # needed as exceptions don't halt integration
-        try:
-            return merge_particles(sim_p, collision, ed=extradata)
-        except BaseException as exception:
-            print("exception during collision_resolve")
-            print(exception)
-            abort = True
-            sim_p.contents._status = 1
-            raise exception
+    assert sim.dt < innermost_period(sim, arrays) / MIN_TIMESTEP_PER_ORBIT
 
-    sim.collision_resolve = collision_resolve_handler
+    sim.collision_resolve = state.collision_resolve_handler
 
     # show_orbits(sim)
 
-    fn.with_suffix(".lock").touch()
+    write_lock(fn)
     print("start")
 
     while t <= tmax:
@@ -231,67 +322,120 @@ def main(fn: Path, testrun=False):
             t += per_savestep
         except NoParticles:
             print("No Particles left")
-            abort = True
+            state.abort = True
         print("N", sim.N)
         print("N_active", sim.N_active)
 
-        print("fraction", innermost_period(sim) / MIN_TIMESTEP_PER_ORBIT)
-        assert sim.dt < innermost_period(sim) / MIN_TIMESTEP_PER_ORBIT
-
-        escape: hb_event
-        wide_orbit: hb_event
-        sun_collision: hb_event
-        for escape in hb_event_list.in_dll(clibheartbeat, "hb_escapes"):
-            if not escape.new:
-                continue
-            print("escape:", escape.time, escape.hash)
-            extradata.pdata[escape.hash].escaped = escape.time
-            escape.new = 0  # make sure to not handle it again
-        c_int.in_dll(clibheartbeat, "hb_escape_index").value = 0
-        for sun_collision in hb_event_list.in_dll(clibheartbeat, "hb_sun_collisions"):
-            if not sun_collision.new:
-                continue
-            print("sun collision:", sun_collision.time, sun_collision.hash)
-            extradata.pdata[sun_collision.hash].collided_with_sun = sun_collision.time
-            sun_collision.new = 0
-        c_int.in_dll(clibheartbeat, "hb_sun_collision_index").value = 0
-        for wide_orbit in hb_event_list.in_dll(clibheartbeat, "hb_wide_orbits"):
-            if not wide_orbit.new:
-                continue
-            print("wide orbit:", wide_orbit.time, wide_orbit.hash)
-            extradata.pdata[wide_orbit.hash].wide_orbit = wide_orbit.time
-            wide_orbit.new = 0
-        c_int.in_dll(clibheartbeat, "hb_sun_collision_index").value = 0
+        arrays.update(sim)
+        min_timestep = innermost_period(sim, arrays) / MIN_TIMESTEP_PER_ORBIT
+        print("fraction", min_timestep)
+        assert sim.dt < min_timestep
+
+        for hash, event_type, event_time in heartbeat.drain_events().tolist():
+            if event_type == HB_ESCAPE:
+                print("escape:", event_time, hash)
+                extradata.pdata[hash].escaped = event_time
+            elif event_type == HB_SUN_COLLISION:
+                print("sun collision:", event_time, hash)
+                extradata.pdata[hash].collided_with_sun = event_time
+            elif event_type == HB_WIDE_ORBIT:
+                print("wide orbit:", event_time, hash)
+                extradata.pdata[hash].wide_orbit = event_time
+            else:
+                raise ValueError(f"unknown heartbeat event type {event_type}")
+        if context.events_overflow:
+            raise RuntimeError(f"{context.events_overflow} heartbeat events were lost as the event buffer was full")
+        print(f"heartbeat: {context.orbits_computed} of {context.checks} checks needed the full orbit")
+        extradata.meta.heartbeat_checks = (extradata.meta.heartbeat_checks or 0) + context.checks
+        extradata.meta.heartbeat_orbits_computed = (extradata.meta.heartbeat_orbits_computed or 0) + context.orbits_computed
+        context.checks = context.orbits_computed = 0
+        integrator_stats = heartbeat.read_integrator_stats()
+        print(f"steps: {integrator_stats['steps']}, with encounters: {integrator_stats['encounter_steps']}, "
+              f"collisions: {state.num_collisions}")
+        extradata.integrator_stats.append(time=sim.t, collisions=state.num_collisions, **integrator_stats)
+        state.num_collisions = 0
+        # shared with the energy log, so it is not calculated again if the heartbeat already logged this step
+        energy = heartbeat.track_energy()
+        print(f"energy: {context.energy_evaluations} evaluations took {context.energy_time:.3f} s")
+        extradata.meta.energy_evaluations = (extradata.meta.energy_evaluations or 0) + context.energy_evaluations
+        extradata.meta.energy_time = (extradata.meta.energy_time or 0) + context.energy_time
+        context.energy_evaluations = 0
+        context.energy_time = 0
         sim.simulationarchive_snapshot(str(fn.with_suffix(".bin")))
+        snapshot_count += 1
+        if not heartbeat.flush_energylog():
+            print("writing the energy log failed")
         extradata.meta.walltime = time.perf_counter() - start + walltimeoffset
         extradata.meta.cputime = time.process_time() + cputimeoffset
         extradata.meta.current_time = t
         extradata.history.append(
-            energy=sim.calculate_energy(),
-            momentum=total_momentum(sim),
-            total_mass=total_mass(sim),
+            energy=energy,
+            momentum=total_momentum(sim, arrays),
+            total_mass=total_mass(sim, arrays),
             time=sim.t,
             N=sim.N,
             N_active=sim.N_active
         )
-        extradata.save(fn)
-        if abort:
+        extradata.save_incremental(fn)
+        update_catalog(fn, extradata, snapshot_count)
+        if state.abort:
             print("aborted")
-            exit(1)
+            return False
+    extradata.save(fn)
+    update_catalog(fn, extradata, snapshot_count)
     print("finished")
     fn.with_suffix(".lock").unlink()
+    return True
+
+
+def run_in_threads(fns: List[Path], testrun=False) -> bool:
+    """
+    integrates several simulations at the same time in this process
+
+    REBOUND releases the GIL while integrating, so they run in parallel
+    and share one loaded mass loss estimator and heartbeat library.
+    The output of all simulations is interleaved.
+    """
+    results = {}
+
+    def run(fn: Path) -> None:
+        try:
+            results[fn] = main(fn, testrun)
+        except Exception:
+            print(f"{fn.name} failed:")
+            traceback.print_exc()
+            results[fn] = False
+
+    threads = [Thread(target=run, args=(fn,), name=fn.name, daemon=True) for fn in fns]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return all(results[fn] for fn in fns)
 
 
 if __name__ == '__main__':
-    fn = filename_from_argv()
-    process_friendlyness(fn)
+    # water_sim.py run [run ...] [test]
+    arguments = argv[1:]
     testrun = False
-    if len(argv) > 2 and argv[2] == "test":
+    if len(arguments) > 1 and arguments[-1] == "test":
         testrun = True
+        arguments = arguments[:-1]
+    fns = [filename_from_argv(argument) for argument in arguments] or [filename_from_argv()]
+    process_friendlyness(fns[0])
     try:
-        main(fn, testrun)
+        if len(fns) == 1:
+            success = main(fns[0], testrun)
+        else:
+            success = run_in_threads(fns, testrun)
     except KeyboardInterrupt:
         print("aborting")
-        lockfile = fn.with_suffix(".lock")
-        print(f"deleting {lockfile}")
-        lockfile.unlink()
+        for fn in fns:
+            lockfile = fn.with_suffix(".lock")
+            # the scheduler of another host could already have taken over the run
+            if lockfile.exists() and lock_owner(fn) == (socket.gethostname(), os.getpid()):
+                print(f"deleting {lockfile}")
+                lockfile.unlink()
+        success = True
+    if not success:
+        exit(1)